@@ -1,123 +1,108 @@
 # -*- coding: utf-8 -*-
 """
 Нумерация листов в Revit с графическим интерфейсом
-Показывает окно со списком всех листов, позволяет выбрать нужные и указать начальный номер
+Показывает окно со списком всех листов, позволяет выбрать нужные и указать начальный номер.
+Сборки WPF загружаются, только когда окно действительно показывается;
+окно появляется до чтения листов документа.
 """
 
+import os
+import sys
+import time
+script_started = time.perf_counter()
 import clr
 clr.AddReference('RevitAPI')
 clr.AddReference('RevitServices')
-clr.AddReference('PresentationFramework')
 
 from Autodesk.Revit import DB
 from RevitServices.Persistence import DocumentManager
 from RevitServices.Transactions import TransactionManager
-from RevitServices import Elements
-from System.Windows import Application, Window
-from System.Windows.Controls import CheckBox, Button, TextBox, Label, ScrollViewer, StackPanel, DockPanel, Grid, GridSplitter, ComboBox
-from System.Windows import Thickness, HorizontalAlignment, VerticalAlignment
-from System.Windows.Media import Brushes
-from System.Windows.Input import Keyboard, ModifierKeys
-import System
 
-# Получаем текущий документ
-doc = DocumentManager.Instance.CurrentDBDocument
 
-# Получаем все листы
-sheet_collector = DB.FilteredElementCollector(doc)
-sheet_collector.OfClass(DB.ViewSheet)
-all_sheets = sheet_collector.ToElements()
+# Папка со скриптом: пакет sheet_numbering лежит рядом с .dyn/.py файлом
+def get_script_directory():
+    try:
+        return os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        # Внутри узла Python в Dynamo __file__ не определен - берем путь открытого графа
+        clr.AddReference('DynamoRevitDS')
+        import Dynamo
+        workspace = Dynamo.Applications.DynamoRevit().RevitDynamoModel.CurrentWorkspace
+        return os.path.dirname(workspace.FileName)
 
-# Фильтруем только активные листы
-sheets_list = []
-for sheet in all_sheets:
-    if sheet is not None and not sheet.IsPlaceholder:
-        sheets_list.append(sheet)
+script_directory = get_script_directory()
+if script_directory not in sys.path:
+    sys.path.append(script_directory)
 
-# Функция для естественной сортировки (natural sort) - как в Project Browser Revit
-# Преобразует строку в кортеж с типами для правильного сравнения смешанных типов
-import re
-def natural_sort_key(text):
-    """
-    Преобразует строку в ключ для естественной сортировки.
-    Возвращает кортеж кортежей: ((тип, значение), ...)
-    где тип: 0 для чисел, 1 для строк
-    Это позволяет корректно сравнивать смешанные значения.
-    Пример: '12' -> ((0, 12),), '2' -> ((0, 2),), 'A10' -> ((1, 'a'), (0, 10))
-    Сортирует так же, как Project Browser в Revit (1, 2, 3, ..., 9, 10, 11, ...)
-    """
-    if text is None:
-        return ((1, ''),)
-    text = str(text)
-    # Разбиваем строку на части: числа и нечисловые символы
-    parts = []
-    for part in re.split(r'(\d+)', text):
-        if part:
-            # Если часть - число, преобразуем в int, иначе оставляем строкой
-            try:
-                parts.append((0, int(part)))  # 0 - тип для чисел (сравниваются как числа)
-            except ValueError:
-                parts.append((1, part.lower()))  # 1 - тип для строк (сравниваются без учета регистра)
-    return tuple(parts) if parts else ((1, text.lower()),)
+# Модули пакета уже загружены предыдущим запуском в этом сеансе Revit
+warm_start = 'sheet_numbering.engine' in sys.modules
 
-# Функция для получения значения параметра из листа
-def get_sheet_parameter_value(sheet, param_name):
-    """Получает значение параметра из листа по имени"""
-    try:
-        param = sheet.LookupParameter(param_name)
-        if param is not None:
-            storage_type = param.StorageType
-            if storage_type == DB.StorageType.String:
-                value = param.AsString()
-            elif storage_type == DB.StorageType.Integer:
-                value = param.AsInteger()
-            elif storage_type == DB.StorageType.Double:
-                value = param.AsDouble()
-            elif storage_type == DB.StorageType.ElementId:
-                elem_id = param.AsElementId()
-                if elem_id.IntegerValue >= 0:
-                    elem = doc.GetElement(elem_id)
-                    value = elem.Name if elem else None
-                else:
-                    value = None
-            else:
-                value = param.AsValueString()
-            return value if value is not None else ""
-        return ""
-    except:
-        return ""
+from sheet_numbering import engine, instrument
+from sheet_numbering.cache import session_cache
+from sheet_numbering.listmodel import SheetListModel
+from sheet_numbering.planner import NumberIndex, schedule
+from sheet_numbering.preview import RenumberPreview
+from sheet_numbering.template import NumberTemplate
+
+# Журнал нумерации: ".jsonl" (JSON Lines) или ".csv"; пишется во временную папку
+LOG_EXTENSION = ".jsonl"
+# Параметры листов для дополнительных фильтров (том, дисциплина, комплект и т.д.).
+# Фильтр показывается, если у листов есть непустые значения параметра
+FACET_PARAMETERS = ("Текущая редакция",)
+# Задержка поиска после ввода символа, мс
+SEARCH_DELAY = 200
+# С какого числа шагов записи показывается окно хода выполнения с кнопкой отмены
+PROGRESS_MIN_STEPS = 500
+# Замеры этапов и счетчики вызовов Revit API (раздел "instrumentation" выхода OUT)
+INSTRUMENTATION = False
+# Записывать трассировку этапов (Chrome Trace Event) во временную папку, рядом с журналом
+TRACE_FILE = False
+
+# Получаем текущий документ
+doc = DocumentManager.Instance.CurrentDBDocument
+instrumentation = instrument.start(INSTRUMENTATION, TRACE_FILE, origin=script_started)
 
-# Сортируем по номеру листа с использованием естественной сортировки
-sheets_list.sort(key=lambda x: natural_sort_key(x.SheetNumber))
+def instrumentation_output():
+    # Раздел замеров для OUT на любом пути завершения; трассировка пишется, если включена
+    trace_path = None
+    if instrumentation.trace:
+        from sheet_numbering.audit import default_log_path
+        trace_path = instrumentation.write_trace(default_log_path(doc.Title, '.trace.json'))
+    return instrumentation.output(trace_path)
 
-# Сохраняем полный отсортированный список листов для фильтрации
-all_sheets_list = list(sheets_list)
+def result_output(report):
+    # Результат без нумерации: текст и раздел замеров
+    return {'report': report, 'instrumentation': instrumentation_output()}
 
-# Получаем уникальные значения параметра "ADSK_Штамп Раздел проекта"
-parameter_name = "ADSK_Штамп Раздел проекта"
-parameter_values = set()
-has_empty_values = False
-for sheet in all_sheets_list:
-    param_value = get_sheet_parameter_value(sheet, parameter_name)
-    param_str = str(param_value) if param_value else ""
-    if param_str.strip():
-        parameter_values.add(param_str)
-    else:
-        has_empty_values = True
-parameter_values_list = sorted(list(parameter_values))
-if has_empty_values:
-    parameter_values_list.append("(Без значения)")
+# Кэш снимков листов на сеанс Revit: при повторном запуске перечитываются
+# только листы, измененные после предыдущего запуска
+snapshot_cache = session_cache()
+snapshot_cache.attach(DB, doc.Application)
 
-if len(sheets_list) == 0:
-    OUT = "Ошибка: В документе нет листов для нумерации"
+# Листы читаются после показа окна (load_sheets); здесь только проверяем,
+# что в документе есть хоть один лист
+if engine.sheet_collector(DB, doc).FirstElement() is None:
+    OUT = result_output("Ошибка: В документе нет листов для нумерации")
 else:
+    # WPF и элементы диалога загружаются только здесь: при пустом документе они не нужны
+    clr.AddReference('PresentationFramework')
+    import System
+    from System.Windows import Window
+    from System.Windows.Controls import Button, CheckBox, TextBox, Label, StackPanel, DockPanel, Grid, GridSplitter, ComboBox
+    from System.Windows import Thickness, HorizontalAlignment, VerticalAlignment
+    from System.Windows.Threading import DispatcherTimer
+    from sheet_numbering.ui import VirtualSheetList, VirtualPreviewList, ProgressWindow
+    
     # Используем список для хранения результата (вместо nonlocal)
-    result_data = {'dialog_result': False, 'selected_sheets': [], 'start_number': 1, 'prefix': ''}
-    checkboxes = []
-    all_checkboxes = []  # Храним все чекбоксы для фильтрации
-    ui_state = {'last_checked_index': -1}  # Индекс последнего выбранного чекбокса для Shift-выбора
+    result_data = {'dialog_result': False, 'selected_sheets': [], 'start_number': 1, 'prefix': '', 'template': None,
+                   'import': None, 'empty': False}
+    # Снимок листов, модель списка и предпросмотр создаются в load_sheets
+    snapshot = None
+    list_model = None
+    preview = None
     
     # Основное окно
+    ui_started = time.perf_counter()
     window = Window()
     window.Title = "Нумерация листов"
     window.Width = 900
@@ -155,13 +140,25 @@ else:
     filter_combo.Width = 250
     filter_combo.Height = 25
     filter_combo.VerticalAlignment = VerticalAlignment.Center
-    filter_combo.Items.Add("Все")
-    for value in parameter_values_list:
-        filter_combo.Items.Add(value)
-    filter_combo.SelectedIndex = 0  # По умолчанию "Все"
     
     filter_panel.Children.Add(filter_label)
     filter_panel.Children.Add(filter_combo)
+    
+    # Дополнительные фильтры: выпадающий список на каждый параметр из FACET_PARAMETERS
+    # (создаются в fill_filters, когда снимок прочитан)
+    facet_combos = {}
+    
+    # Поиск по номеру и имени листа
+    search_label = Label()
+    search_label.Content = "Поиск:"
+    search_label.Margin = Thickness(20, 0, 10, 0)
+    search_label.VerticalAlignment = VerticalAlignment.Center
+    search_box = TextBox()
+    search_box.Width = 150
+    search_box.VerticalAlignment = VerticalAlignment.Center
+    search_box.ToolTip = "Слова из номера или имени листа (начало слова), например: ар 12"
+    filter_panel.Children.Add(search_label)
+    filter_panel.Children.Add(search_box)
     Grid.SetRow(filter_panel, 0)
     main_grid.Children.Add(filter_panel)
     
@@ -180,68 +177,61 @@ else:
     btn_deselect_all.Margin = Thickness(0, 0, 5, 0)
     btn_deselect_all.Width = 100
     
+    btn_import = Button()
+    btn_import.Content = "Импорт из файла..."
+    btn_import.Margin = Thickness(20, 0, 5, 0)
+    btn_import.Width = 130
+    btn_import.ToolTip = ("Новые номера из CSV или JSON: колонки element_id, номер или имя листа и новый номер.\n"
+                          "Листы из файла выбираются, предпросмотр показывает номера из файла")
+    
     top_panel.Children.Add(btn_select_all)
     top_panel.Children.Add(btn_deselect_all)
+    top_panel.Children.Add(btn_import)
     Grid.SetRow(top_panel, 1)
     main_grid.Children.Add(top_panel)
     
-    # Средняя часть - список листов с прокруткой (заполняет всю ширину, изменяется при изменении размера окна)
-    scroll_viewer = ScrollViewer()
-    scroll_viewer.Margin = Thickness(0, 0, 0, 10)
-    scroll_viewer.VerticalScrollBarVisibility = System.Windows.Controls.ScrollBarVisibility.Auto
-    scroll_viewer.HorizontalScrollBarVisibility = System.Windows.Controls.ScrollBarVisibility.Auto
-    
-    sheets_panel = StackPanel()
-    sheets_panel.Orientation = System.Windows.Controls.Orientation.Vertical
-    
-    # Создаем чекбоксы для каждого листа
-    def checkbox_preview_mousedown(sender, e):
-        try:
-            # Если зажат Shift, обрабатываем выбор диапазона
-            if e.ChangedButton == System.Windows.Input.MouseButton.Left:
-                if Keyboard.Modifiers == ModifierKeys.Shift and ui_state['last_checked_index'] >= 0:
-                    current_index = checkboxes.index(sender)
-                    # Выбираем диапазон от last_checked_index до current_index
-                    start_idx = min(ui_state['last_checked_index'], current_index)
-                    end_idx = max(ui_state['last_checked_index'], current_index)
-                    
-                    # Запоминаем состояние последнего чекбокса
-                    last_state = checkboxes[ui_state['last_checked_index']].IsChecked
-                    
-                    # Выбираем/снимаем все в диапазоне
-                    for idx in range(start_idx, end_idx + 1):
-                        checkboxes[idx].IsChecked = last_state
-                    
-                    ui_state['last_checked_index'] = current_index
-                    e.Handled = True
-        except:
-            pass
-    
-    def checkbox_click(sender, e):
-        try:
-            # Запоминаем индекс последнего выбранного чекбокса
-            current_index = checkboxes.index(sender)
-            ui_state['last_checked_index'] = current_index
-        except:
-            pass
-    
-    # Функция для создания чекбокса
-    def create_checkbox(sheet):
-        checkbox = CheckBox()
-        checkbox.Content = "[{0}] {1}".format(sheet.SheetNumber, sheet.Name)
-        checkbox.Tag = sheet
-        checkbox.IsChecked = False
-        checkbox.Margin = Thickness(5)
-        checkbox.PreviewMouseDown += checkbox_preview_mousedown
-        checkbox.Click += checkbox_click
-        return checkbox
-    
-    # Создаем чекбоксы для всех листов (сохраняем в all_checkboxes)
-    for sheet in all_sheets_list:
-        checkbox = create_checkbox(sheet)
-        all_checkboxes.append(checkbox)
-        checkboxes.append(checkbox)
-        sheets_panel.Children.Add(checkbox)
+    # Средняя часть - список листов и предпросмотр нумерации (заполняют всю ширину, изменяются при изменении размера окна)
+    middle_grid = Grid()
+    middle_grid.Margin = Thickness(0, 0, 0, 10)
+    middle_grid.ColumnDefinitions.Add(System.Windows.Controls.ColumnDefinition())
+    middle_grid.ColumnDefinitions.Add(System.Windows.Controls.ColumnDefinition())
+    middle_grid.ColumnDefinitions.Add(System.Windows.Controls.ColumnDefinition())
+    middle_grid.ColumnDefinitions[0].Width = System.Windows.GridLength(3, System.Windows.GridUnitType.Star)  # Список
+    middle_grid.ColumnDefinitions[1].Width = System.Windows.GridLength(0, System.Windows.GridUnitType.Auto)  # Разделитель
+    middle_grid.ColumnDefinitions[2].Width = System.Windows.GridLength(2, System.Windows.GridUnitType.Star)  # Предпросмотр
+    
+    # Список виртуализирован: флажки создаются только для строк, видимых на экране.
+    # Модель и строки добавляются после первого показа окна (load_sheets)
+    sheet_list = VirtualSheetList()
+    Grid.SetColumn(sheet_list.control, 0)
+    middle_grid.Children.Add(sheet_list.control)
+    
+    splitter = GridSplitter()
+    splitter.Width = 5
+    splitter.HorizontalAlignment = HorizontalAlignment.Stretch
+    Grid.SetColumn(splitter, 1)
+    middle_grid.Children.Add(splitter)
+    
+    # Предпросмотр: полный список "старый номер -> новый номер", конфликты выделены красным
+    preview_panel = DockPanel()
+    preview_label = Label()
+    DockPanel.SetDock(preview_label, System.Windows.Controls.Dock.Top)
+    preview_list = VirtualPreviewList()
+    preview_panel.Children.Add(preview_label)
+    preview_panel.Children.Add(preview_list.control)
+    Grid.SetColumn(preview_panel, 2)
+    middle_grid.Children.Add(preview_panel)
+    
+    def update_preview_label():
+        text = "Предпросмотр: листов {0}, конфликтов {1}".format(len(preview), len(preview.conflicts))
+        mapping = result_data['import']
+        if mapping is not None:
+            text += "; импорт: строк {0}, ошибок {1}".format(mapping.rows, len(mapping.errors))
+        preview_label.Content = text
+    
+    def selection_changed(element_ids, state):
+        preview_list.refresh()
+        update_preview_label()
     
     # Функция для фильтрации списка листов
     def filter_sheets(sender, e):
@@ -250,61 +240,70 @@ else:
             if selected_value is None:
                 return
             
-            # Очищаем текущий список
-            sheets_panel.Children.Clear()
-            checkboxes.clear()
-            
-            # Если выбрано "Все", показываем все листы
-            if selected_value == "Все":
-                filtered_sheets = list(all_sheets_list)  # Создаем копию отсортированного списка
-            elif selected_value == "(Без значения)":
-                # Показываем листы без значения параметра
-                filtered_sheets = []
-                for sheet in all_sheets_list:
-                    param_value = get_sheet_parameter_value(sheet, parameter_name)
-                    param_str = str(param_value) if param_value else ""
-                    if not param_str.strip():
-                        filtered_sheets.append(sheet)
-                # Сортируем отфильтрованный список
-                filtered_sheets.sort(key=lambda x: natural_sort_key(x.SheetNumber))
-            else:
-                # Фильтруем по значению параметра
-                filtered_sheets = []
-                for sheet in all_sheets_list:
-                    param_value = get_sheet_parameter_value(sheet, parameter_name)
-                    param_str = str(param_value) if param_value else ""
-                    if param_str == selected_value:
-                        filtered_sheets.append(sheet)
-                
-                # Сортируем отфильтрованный список
-                filtered_sheets.sort(key=lambda x: natural_sort_key(x.SheetNumber))
-            
-            # Создаем чекбоксы для отфильтрованных листов
-            for sheet in filtered_sheets:
-                # Находим соответствующий чекбокс из всех
-                for cb in all_checkboxes:
-                    if cb.Tag == sheet:
-                        checkbox = cb
-                        break
-                else:
-                    # Если не нашли, создаем новый
-                    checkbox = create_checkbox(sheet)
-                    all_checkboxes.append(checkbox)
-                
-                checkboxes.append(checkbox)
-                sheets_panel.Children.Add(checkbox)
-                
-            # Сбрасываем индекс последнего выбранного
-            ui_state['last_checked_index'] = -1
+            # Показываем листы раздела из индекса снимка (порядок сортировки сохраняется),
+            # индекс последнего выбранного сбрасывается
+            sheet_list.set_filter(selected_value)
         except Exception as ex:
             pass
     
-    # Подключаем обработчик изменения фильтра
-    filter_combo.SelectionChanged += filter_sheets
+    def filter_facet(sender, e):
+        try:
+            if sender.SelectedItem is not None:
+                sheet_list.set_facet(facet_combos[sender], sender.SelectedItem)
+        except Exception as ex:
+            pass
+    
+    def fill_filters():
+        # Значения параметра "ADSK_Штамп Раздел проекта" и дополнительных параметров из снимка;
+        # обработчики подключаются после заполнения, чтобы выбор "Все" не фильтровал список
+        filter_combo.Items.Add(engine.ALL_VALUE)
+        for value in snapshot.section_values():
+            filter_combo.Items.Add(value)
+        filter_combo.SelectedIndex = 0  # По умолчанию "Все"
+        filter_combo.SelectionChanged += filter_sheets
+        position = filter_panel.Children.IndexOf(search_label)
+        for facet_name in snapshot.facet_params:
+            facet = snapshot.facets[facet_name]
+            if not facet.has_values():
+                continue
+            facet_label = Label()
+            facet_label.Content = facet_name + ":"
+            facet_label.Margin = Thickness(20, 0, 10, 0)
+            facet_label.VerticalAlignment = VerticalAlignment.Center
+            facet_combo = ComboBox()
+            facet_combo.Width = 150
+            facet_combo.Height = 25
+            facet_combo.VerticalAlignment = VerticalAlignment.Center
+            facet_combo.Items.Add(engine.ALL_VALUE)
+            for value in facet.value_list():
+                facet_combo.Items.Add(value)
+            facet_combo.SelectedIndex = 0
+            facet_combo.SelectionChanged += filter_facet
+            facet_combos[facet_combo] = facet_name
+            filter_panel.Children.Insert(position, facet_label)
+            filter_panel.Children.Insert(position + 1, facet_combo)
+            position += 2
+    
+    # Поиск выполняется после паузы во вводе, а не на каждый символ
+    search_timer = DispatcherTimer()
+    search_timer.Interval = System.TimeSpan.FromMilliseconds(SEARCH_DELAY)
+    
+    def search_tick(sender, e):
+        search_timer.Stop()
+        try:
+            sheet_list.set_search(search_box.Text)
+        except Exception as ex:
+            pass
+    
+    def search_changed(sender, e):
+        search_timer.Stop()
+        search_timer.Start()
+    
+    search_timer.Tick += search_tick
+    search_box.TextChanged += search_changed
     
-    scroll_viewer.Content = sheets_panel
-    Grid.SetRow(scroll_viewer, 2)
-    main_grid.Children.Add(scroll_viewer)
+    Grid.SetRow(middle_grid, 2)
+    main_grid.Children.Add(middle_grid)
     
     # Нижняя панель - начальный номер и кнопки (закреплены справа внизу)
     bottom_grid = Grid()
@@ -330,7 +329,9 @@ else:
     prefix_box.Text = ""
     prefix_box.Width = 80
     prefix_box.VerticalAlignment = VerticalAlignment.Center
-    prefix_box.ToolTip = "Префикс перед номером (например, A, 1-A, и т.д.)"
+    prefix_box.ToolTip = ("Префикс перед номером (например, A, 1-A, и т.д.) или шаблон номера:\n"
+                          "{n} - счетчик ({n:03} - с нулями до трех знаков), {section} - раздел проекта,\n"
+                          "{number} - текущий номер, {name} - имя листа. Например: АР-{n:03}, {section}.{n}")
     
     start_label = Label()
     start_label.Content = "Начальный номер:"
@@ -342,10 +343,28 @@ else:
     start_number_box.Width = 60
     start_number_box.VerticalAlignment = VerticalAlignment.Center
     
+    step_label = Label()
+    step_label.Content = "Шаг:"
+    step_label.Margin = Thickness(20, 0, 10, 0)
+    step_label.VerticalAlignment = VerticalAlignment.Center
+    
+    step_box = TextBox()
+    step_box.Text = "1"
+    step_box.Width = 40
+    step_box.VerticalAlignment = VerticalAlignment.Center
+    
+    per_section_box = CheckBox()
+    per_section_box.Content = "Счет заново в каждом разделе"
+    per_section_box.Margin = Thickness(20, 0, 0, 0)
+    per_section_box.VerticalAlignment = VerticalAlignment.Center
+    
     left_panel.Children.Add(prefix_label)
     left_panel.Children.Add(prefix_box)
     left_panel.Children.Add(start_label)
     left_panel.Children.Add(start_number_box)
+    left_panel.Children.Add(step_label)
+    left_panel.Children.Add(step_box)
+    left_panel.Children.Add(per_section_box)
     Grid.SetColumn(left_panel, 0)
     bottom_grid.Children.Add(left_panel)
     
@@ -376,24 +395,61 @@ else:
     
     # Обработчики событий
     def select_all(sender, e):
-        for cb in checkboxes:
-            cb.IsChecked = True
+        list_model.set_all_visible(True)
+        sheet_list.refresh()
     
     def deselect_all(sender, e):
-        for cb in checkboxes:
-            cb.IsChecked = False
+        list_model.set_all_visible(False)
+        sheet_list.refresh()
+    
+    def import_click(sender, e):
+        # Номера из файла заменяют шаблон, выбираются листы из файла
+        from Microsoft.Win32 import OpenFileDialog
+        from sheet_numbering.importer import import_mapping
+        dialog = OpenFileDialog()
+        dialog.Title = "Файл соответствия номеров"
+        dialog.Filter = "CSV и JSON (*.csv;*.txt;*.json;*.jsonl)|*.csv;*.txt;*.json;*.jsonl|Все файлы (*.*)|*.*"
+        if dialog.ShowDialog(window) != True:
+            return
+        try:
+            mapping = import_mapping(snapshot, dialog.FileName)
+        except Exception as ex:
+            preview_label.Content = "Ошибка чтения файла: {0}".format(ex)
+            return
+        result_data['import'] = mapping
+        preview.set_template(mapping)
+        list_model.select_only(mapping.numbers)
+        sheet_list.refresh()
+        preview_list.refresh()
+        update_preview_label()
+        errors = mapping.error_messages()
+        if len(errors) > 50:
+            errors = errors[:50] + ["... и еще {0}".format(len(errors) - 50)]
+        preview_label.ToolTip = "\n".join(errors) if errors else None
+    
+    def read_template():
+        # Шаблон номера из полей префикса, начального номера, шага и флажка разделов
+        prefix = prefix_box.Text.strip() if prefix_box.Text else ''
+        start_number = engine.parse_integer(start_number_box.Text)
+        step = engine.parse_integer(step_box.Text)
+        return NumberTemplate.parse(prefix, start_number, step, per_section_box.IsChecked == True)
     
     def ok_click(sender, e):
-        result_data['selected_sheets'] = []
-        # Собираем выбранные листы из всех чекбоксов, а не только видимых
-        for cb in all_checkboxes:
-            if cb.IsChecked == True:
-                result_data['selected_sheets'].append(cb.Tag)
-        try:
-            result_data['start_number'] = int(start_number_box.Text)
-        except:
-            result_data['start_number'] = 1
-        result_data['prefix'] = prefix_box.Text.strip() if prefix_box.Text else ''
+        if result_data['import'] is not None:
+            template = result_data['import']
+            result_data['start_number'] = None
+            result_data['prefix'] = ''
+        else:
+            try:
+                template = read_template()
+            except ValueError as ex:
+                preview_label.Content = str(ex)
+                return
+            result_data['start_number'] = template.start
+            result_data['prefix'] = prefix_box.Text.strip() if prefix_box.Text else ''
+        # Собираем выбранные листы из модели выбора, а не только видимые
+        result_data['selected_sheets'] = list_model.selected_records()
+        result_data['template'] = template
         result_data['dialog_result'] = True
         window.DialogResult = True
         window.Close()
@@ -402,81 +458,134 @@ else:
         window.DialogResult = False
         window.Close()
     
+    def numbering_changed(sender, e):
+        # Пересчитываем предпросмотр при изменении шаблона, начального номера или шага
+        # (импортированные номера при этом больше не используются)
+        try:
+            result_data['import'] = None
+            preview_label.ToolTip = None
+            preview.set_template(read_template())
+            preview_list.refresh()
+            update_preview_label()
+        except ValueError as ex:
+            preview_label.Content = str(ex)
+        except:
+            pass
+    
+    prefix_box.TextChanged += numbering_changed
+    start_number_box.TextChanged += numbering_changed
+    step_box.TextChanged += numbering_changed
+    per_section_box.Click += numbering_changed
     btn_select_all.Click += select_all
     btn_deselect_all.Click += deselect_all
+    btn_import.Click += import_click
     btn_ok.Click += ok_click
     btn_cancel.Click += cancel_click
     
     window.Content = main_grid
+    instrumentation.add('ui_build', time.perf_counter() - ui_started, ui_started)
+    
+    # Окно показывается сразу, листы читаются после первой отрисовки;
+    # до этого элементы окна недоступны
+    main_grid.IsEnabled = False
+    preview_label.Content = "Загрузка листов..."
+    
+    def load_sheets(sender, e):
+        global snapshot, list_model, preview
+        window.ContentRendered -= load_sheets
+        shown = time.perf_counter()
+        instrumentation.add('window_shown', shown - script_started, script_started)
+        # Все активные листы и их данные за один проход: снимок хранит список,
+        # отсортированный как в Project Browser, индексы фильтров и индекс поиска
+        # (строится здесь, пока окно недоступно, а не при первом вводе в поиск)
+        snapshot = snapshot_cache.snapshot(DB, doc, facet_params=FACET_PARAMETERS, search=True)
+        if len(snapshot) == 0:
+            # В документе только заглушки листов
+            result_data['empty'] = True
+            window.Close()
+            return
+        # Модель списка: строка на каждый лист, текущий фильтр и выбранные element_id
+        # (состояние флажков хранится в модели, а не в CheckBox.IsChecked)
+        list_model = SheetListModel(snapshot)
+        # Предпросмотр нумерации: пересчитывается при изменении выбора, префикса и начального номера.
+        # Индекс номеров документа - записи снимка и номера заглушек из кэша
+        numbers = NumberIndex.from_records(snapshot.records, snapshot_cache.placeholders(doc))
+        preview = RenumberPreview(snapshot, numbers)
+        list_model.selection.listeners.append(preview.selection_changed)
+        list_model.selection.listeners.append(selection_changed)
+        fill_filters()
+        with instrumentation.phase('list_fill'):
+            sheet_list.bind(list_model)
+            preview_list.bind(preview)
+            update_preview_label()
+        main_grid.IsEnabled = True
+        instrumentation.add('startup_warm' if warm_start else 'startup_cold',
+                            time.perf_counter() - script_started, script_started)
+    
+    window.ContentRendered += load_sheets
     
     # Запускаем окно
     result = window.ShowDialog()
+    search_timer.Stop()
     
     # Обрабатываем результат
-    if result == True and result_data['dialog_result'] == True and len(result_data['selected_sheets']) > 0:
+    if result_data['empty']:
+        OUT = result_output("Ошибка: В документе нет листов для нумерации")
+    elif result == True and result_data['dialog_result'] == True and len(result_data['selected_sheets']) > 0:
         try:
-            # Начинаем транзакцию
-            TransactionManager.Instance.ForceCloseTransaction()
-            t = DB.Transaction(doc, "Нумерация листов")
-            t.Start()
-            
-            renumbered_sheets = []
-            current_number = result_data['start_number']
-            errors = []
-            
-            # Нумеруем выбранные листы
-            for sheet in result_data['selected_sheets']:
-                if hasattr(sheet, 'InternalElement'):
-                    sheet_unwrapped = sheet.InternalElement
-                else:
-                    sheet_unwrapped = sheet
-                
-                if sheet_unwrapped is not None and hasattr(sheet_unwrapped, 'SheetNumber'):
-                    try:
-                        old_number = sheet_unwrapped.SheetNumber
-                        # Формируем новый номер: префикс + номер
-                        prefix = result_data.get('prefix', '')
-                        if prefix:
-                            new_number = prefix + str(current_number)
-                        else:
-                            new_number = str(current_number)
-                        
-                        sheet_unwrapped.SheetNumber = new_number
-                        renumbered_sheets.append("Лист {0} -> {1}".format(old_number, new_number))
-                        current_number += 1
-                    except Exception as e:
-                        errors.append("Ошибка при нумерации листа: {0}".format(str(e)))
+            from sheet_numbering.audit import STATUS_ROLLED_BACK, RenumberLog, default_log_path, open_log_writer
+            from sheet_numbering.commit import Cancellation, commit_chunked
             
-            t.Commit()
-            
-            # Формируем результат
-            result_parts = ["Нумерация завершена!"]
-            prefix_str = result_data.get('prefix', '')
-            if prefix_str:
-                result_parts.append("Префикс: {0}".format(prefix_str))
-            result_parts.append("Начальный номер: {0}".format(result_data['start_number']))
-            result_parts.append("Обработано листов: {0}".format(len(renumbered_sheets)))
+            # Номера записываются частями в своей группе транзакций - транзакцию Dynamo закрываем
+            TransactionManager.Instance.ForceCloseTransaction()
             
-            if len(renumbered_sheets) > 0:
-                result_parts.append("")
-                for i, result in enumerate(renumbered_sheets[:50]):
-                    result_parts.append(result)
-                if len(renumbered_sheets) > 50:
-                    result_parts.append("... и еще {0} листов".format(len(renumbered_sheets) - 50))
+            # Строим план и порядок записи номеров без конфликтов
+            # (номера, занятые другими листами и заглушками, проверяются заранее;
+            # пока окно открыто, документ не меняется, поэтому индекс предпросмотра актуален)
+            with instrumentation.phase('plan'):
+                plan = result_data['template'].plan(result_data['selected_sheets'])
+            steps = schedule(plan, preview.numbers)
             
-            if len(errors) > 0:
-                result_parts.append("")
-                result_parts.append("Ошибки:")
-                for error in errors:
-                    result_parts.append(error)
+            # Нумеруем выбранные листы; результат каждого листа сразу пишется в журнал.
+            # Для больших планов показывается ход выполнения; при отмене группа
+            # транзакций откатывается и номера листов остаются прежними
+            log_path = default_log_path(doc.Title, LOG_EXTENSION)
+            log = RenumberLog([open_log_writer(log_path)])
+            cancellation = Cancellation()
+            progress_window = None
+            if len(steps) >= PROGRESS_MIN_STEPS:
+                progress_window = ProgressWindow("Нумерация листов", len(steps), cancellation)
+                progress_window.show()
+            try:
+                commit_result = commit_chunked(DB, doc, steps, snapshot, log,
+                                               progress_window.update if progress_window is not None else None,
+                                               cancellation)
+            finally:
+                log.close()
+                if progress_window is not None:
+                    progress_window.close()
             
-            OUT = "\r\n".join(result_parts)
+            # Формируем результат: текстовый отчет и структурированные данные
+            # (сводка по статусам, путь к журналу, записи первых листов)
+            mapping = result_data['import']
+            import_errors = mapping.errors[:log.limit] if mapping is not None else []
+            report = log.report(result_data['start_number'], result_data.get('prefix', ''),
+                                ["Строка {0}: {1}".format(line, message) for line, message in import_errors])
+            if commit_result.cancelled:
+                report = "Операция отменена пользователем: изменения откачены ({0} листов)".format(
+                    log.counts[STATUS_ROLLED_BACK])
+            OUT = log.output(report, log_path,
+                             import_errors=[{'line': line, 'message': message} for line, message in import_errors],
+                             commit=commit_result.output(),
+                             instrumentation=instrumentation_output())
         except Exception as e:
+            # Номера в снимке могли измениться без подтверждения транзакции
+            snapshot_cache.invalidate(doc)
             import traceback
             error_msg = "Ошибка при выполнении скрипта:\r\n{0}\r\n\r\n{1}".format(str(e), traceback.format_exc())
-            OUT = error_msg
+            OUT = result_output(error_msg)
     elif result == False:
-        OUT = "Операция отменена пользователем"
+        OUT = result_output("Операция отменена пользователем")
     else:
-        OUT = "Ошибка: Не выбраны листы для нумерации"
+        OUT = result_output("Ошибка: Не выбраны листы для нумерации")
 
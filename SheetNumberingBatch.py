@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная нумерация листов нескольких документов (узел Python в Dynamo)
+Входы узла:
+    IN[0] - список документов или путей к снимкам листов (.json, см. batch.export_snapshot);
+            обязательный вход. Связанные документы и документы семейств пропускаются
+    IN[1] - шаблон номера или префикс (например "АР-{n:03}"), обязательный вход
+    IN[2] - начальный номер (по умолчанию 1)
+    IN[3] - шаг (по умолчанию 1)
+    IN[4] - счет заново в каждом разделе (True/False)
+    IN[5] - значение параметра "ADSK_Штамп Раздел проекта" (по умолчанию все листы)
+    IN[6] - папка для выгрузки снимков: если задана, документы не нумеруются,
+            а их снимки записываются в папку для планирования вне Revit
+            (python -m sheet_numbering.batch <снимки> --template ...)
+Без документов или шаблона узел ничего не нумерует и возвращает ошибку:
+неподключенный узел в автоматическом режиме не должен менять проекты.
+Выход OUT - сводка пакета (листов в секунду, время планирования и записи)
+и результаты каждого документа с путем к журналу нумерации; при включенных
+замерах (INSTRUMENTATION) - время этапов и счетчики вызовов Revit API.
+"""
+
+import os
+import sys
+import clr
+clr.AddReference('RevitAPI')
+clr.AddReference('RevitServices')
+
+from Autodesk.Revit import DB
+from RevitServices.Persistence import DocumentManager
+from RevitServices.Transactions import TransactionManager
+
+
+# Папка со скриптом: пакет sheet_numbering лежит рядом с .dyn/.py файлом
+def get_script_directory():
+    try:
+        return os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        # Внутри узла Python в Dynamo __file__ не определен - берем путь открытого графа
+        clr.AddReference('DynamoRevitDS')
+        import Dynamo
+        workspace = Dynamo.Applications.DynamoRevit().RevitDynamoModel.CurrentWorkspace
+        return os.path.dirname(workspace.FileName)
+
+script_directory = get_script_directory()
+if script_directory not in sys.path:
+    sys.path.append(script_directory)
+
+from sheet_numbering import engine, instrument
+from sheet_numbering.audit import default_log_path
+from sheet_numbering.batch import export_snapshots, run_batch
+from sheet_numbering.cache import session_cache
+from sheet_numbering.template import NumberTemplate
+
+# Журнал нумерации: ".jsonl" (JSON Lines) или ".csv"; пишется во временную папку
+LOG_EXTENSION = ".jsonl"
+# Замеры этапов и счетчики вызовов Revit API (раздел "instrumentation" выхода OUT)
+INSTRUMENTATION = False
+# Записывать трассировку этапов (Chrome Trace Event) во временную папку, рядом с журналами
+TRACE_FILE = False
+
+
+def get_input(index, default=None):
+    try:
+        value = IN[index]
+    except (NameError, IndexError):
+        return default
+    return default if value is None else value
+
+
+doc = DocumentManager.Instance.CurrentDBDocument
+
+sources = get_input(0)
+if sources is not None and not isinstance(sources, (list, tuple)):
+    sources = [sources]
+template_text = str(get_input(1, "")).strip()
+section = get_input(5)
+section = str(section) if section not in (None, "") else engine.ALL_VALUE
+export_directory = str(get_input(6, "")).strip()
+
+template = None
+if not sources:
+    OUT = "Ошибка: не заданы документы для нумерации (IN[0])"
+elif export_directory:
+    # Только выгрузка снимков: документы не изменяются
+    snapshot_cache = session_cache()
+    snapshot_cache.attach(DB, doc.Application)
+    OUT = {'snapshots': export_snapshots(DB, sources, export_directory, snapshot_cache)}
+elif not template_text:
+    OUT = "Ошибка: не задан шаблон номера (IN[1])"
+else:
+    try:
+        template = NumberTemplate.parse(template_text,
+                                        engine.parse_integer(str(get_input(2, 1))),
+                                        engine.parse_integer(str(get_input(3, 1))),
+                                        bool(get_input(4, False)))
+    except ValueError as e:
+        OUT = "Ошибка: {0}".format(e)
+
+if template is not None:
+    # Открытые документы Dynamo уже держит в транзакции - закрываем ее,
+    # чтобы каждый документ нумеровался в своей транзакции
+    TransactionManager.Instance.ForceCloseTransaction()
+    instrumentation = instrument.start(INSTRUMENTATION, TRACE_FILE)
+    snapshot_cache = session_cache()
+    snapshot_cache.attach(DB, doc.Application)
+    OUT = run_batch(DB, sources, template, snapshot_cache, section, log_extension=LOG_EXTENSION).output()
+    if instrumentation.enabled:
+        trace_path = None
+        if instrumentation.trace:
+            trace_path = instrumentation.write_trace(default_log_path("batch", '.trace.json'))
+        OUT['instrumentation'] = instrumentation.output(trace_path)
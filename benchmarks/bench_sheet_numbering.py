@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+"""
+Замер производительности нумерации листов на синтетических проектах.
+Каждая фаза скрипта замеряется отдельно, результаты пишутся в JSON,
+который можно сравнить с предыдущим запуском (--compare).
+
+Запуск:
+    python benchmarks/bench_sheet_numbering.py --sizes 10 1000 10000 100000
+    python benchmarks/bench_sheet_numbering.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheet_numbering import engine, instrument
+from sheet_numbering import standin as DB
+from sheet_numbering.snapshot import SheetSnapshot, take_snapshot
+from sheet_numbering.cache import SnapshotCache
+from sheet_numbering.selection import SelectionModel
+from sheet_numbering.listmodel import SheetListModel
+from sheet_numbering.sorting import SortKeyCache, SortedSheetIndex
+from sheet_numbering.planner import NumberIndex, schedule, apply_schedule
+from sheet_numbering.preview import RenumberPreview
+from sheet_numbering.template import NumberTemplate
+from sheet_numbering.importer import import_mapping
+from sheet_numbering.audit import RenumberLog, open_log_writer
+from sheet_numbering.commit import Cancellation, ChunkSizer, commit_chunked
+from sheet_numbering.batch import job_from_snapshot, plan_jobs, run_batch
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+# Допустимое замедление фазы относительно предыдущего запуска
+DEFAULT_THRESHOLD = 1.25
+# Число документов в пакетной нумерации
+BATCH_DOCUMENTS = 4
+
+
+# Номера, на которых проверяется совпадение ключа сортировки с исходным
+SORT_KEY_SAMPLES = [
+    None, "", " ", "1", "01", "001", "10", "2", "A", "a", "A1", "a01", "A-101", "a-101",
+    "АР-12.3", "ар-12.3", "АР-12.10", "Ё-1", "ё-01", "1-A", "1-a", "1A2B3", "-5", "1.2.3",
+    "١٢", "A١٢", "  7", "Лист 10", "ЛИСТ 9", "0", "00", "9" * 30,
+]
+
+
+def legacy_natural_sort_key(text):
+    """Исходная реализация ключа сортировки - эталон для проверки"""
+    if text is None:
+        return ((1, ''),)
+    text = str(text)
+    parts = []
+    for part in re.split(r'(\d+)', text):
+        if part:
+            try:
+                parts.append((0, int(part)))
+            except ValueError:
+                parts.append((1, part.lower()))
+    return tuple(parts) if parts else ((1, text.lower()),)
+
+
+def legacy_collect_sheets(doc):
+    """Исходный сбор листов: полный список элементов и отсев заглушек в Python"""
+    collector = DB.FilteredElementCollector(doc)
+    collector.OfClass(DB.ViewSheet)
+    sheets = []
+    for sheet in collector.ToElements():
+        if sheet is not None and not sheet.IsPlaceholder:
+            sheets.append(sheet)
+    return sheets
+
+
+def check_sort_keys(numbers, index_limit=10000):
+    """
+    Число номеров, для которых ключ отличается от эталона, плюс 1, если
+    порядок после вставок в SortedSheetIndex (первые index_limit номеров)
+    отличается от сортировки эталонным ключом.
+    """
+    numbers = list(numbers) + SORT_KEY_SAMPLES
+    mismatches = sum(1 for n in numbers if engine.natural_sort_key(n) != legacy_natural_sort_key(n))
+    present = [n for n in numbers[-index_limit:] if n is not None]
+    expected = sorted(present, key=legacy_natural_sort_key)
+    index = SortedSheetIndex()
+    for i, number in enumerate(present):
+        index.add(engine.SheetRecord(i, number, "", ""))
+    if [r.number for r in index] != expected:
+        mismatches += 1
+    return mismatches
+
+
+def measure(func, repeat):
+    """Запускает func repeat раз, возвращает (лучшее время, среднее время, результат)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings), result
+
+
+def snapshot_rows(snapshot):
+    """Содержимое снимка для сравнения: записи и ключи сортировки по порядку"""
+    return ([(r.element_id, r.number, r.name, r.section) for r in sorted(snapshot.records, key=lambda r: r.element_id)],
+            [snapshot.sort_key(r.number) for r in snapshot.records],
+            dict((key, sorted(r.element_id for r in section)) for key, section in snapshot.sections.items()))
+
+
+def replay_changes(doc, change_sets, change_count):
+    """
+    Воспроизводит наборы изменений: кэш обновляет снимок после каждого набора.
+    Возвращает (время обновлений кэша, время полных чтений, число расхождений).
+    """
+    cache = SnapshotCache()
+    cache.attach(DB, doc.Application)
+    cache.snapshot(DB, doc)
+    refresh_time = full_time = 0.0
+    mismatches = 0
+    try:
+        for seed in range(1, change_sets + 1):
+            DB.apply_synthetic_changes(doc, change_count, seed)
+            start = time.perf_counter()
+            cached = cache.snapshot(DB, doc)
+            refresh_time += time.perf_counter() - start
+            start = time.perf_counter()
+            fresh = take_snapshot(DB, doc)
+            full_time += time.perf_counter() - start
+            if snapshot_rows(cached) != snapshot_rows(fresh):
+                mismatches += 1
+            # Индекс номеров из кэша (записи и заглушки) совпадает с перебором документа
+            numbers = NumberIndex.from_records(cached.records, cache.placeholders(doc))
+            if numbers.holders != NumberIndex.from_document(DB, doc).holders:
+                mismatches += 1
+    finally:
+        cache.detach()
+    return refresh_time, full_time, mismatches
+
+
+def preview_conflict_mismatches(snapshot, numbers, templates, rng, steps=6):
+    """
+    Случайные изменения выбора в предпросмотре: после каждого конфликты строк
+    (с причиной) сравниваются с конфликтами planner.schedule для того же плана.
+    Возвращает число расхождений.
+    """
+    ids = [r.element_id for r in snapshot.records]
+    mismatches = 0
+    for template in templates:
+        preview = RenumberPreview(snapshot, numbers, template)
+        for step in range(steps):
+            if step == 0:
+                preview.selection_changed(ids, True)
+            elif rng.random() < 0.5:
+                preview.selection_changed([rng.choice(ids)], rng.random() < 0.5)
+            else:
+                count = rng.randint(1, max(1, len(ids) // 4))
+                preview.selection_changed(rng.sample(ids, count), rng.random() < 0.5)
+            shown = set()
+            for index in preview.conflicts:
+                record, _, conflict = preview.entry(index)
+                shown.add((record.element_id, conflict))
+            planned = set((record.element_id, reason) for record, _, reason in schedule(preview.plan(), numbers).conflicts)
+            mismatches += len(shown ^ planned)
+    return mismatches
+
+
+def write_mapping_files(directory, records):
+    """CSV (;, cp1251 как из Excel) и JSON-массив соответствия номеров со сдвигом по кругу"""
+    csv_path = os.path.join(directory, "mapping.csv")
+    json_path = os.path.join(directory, "mapping.json")
+    with open(csv_path, "w", encoding="cp1251", newline="") as f:
+        f.write("Номер;Новый номер\r\n")
+        for i, r in enumerate(records):
+            f.write("{0};{1}\r\n".format(r.number, records[(i + 1) % len(records)].number))
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for i, r in enumerate(records):
+            f.write(",\n" if i else "")
+            json.dump({"element_id": r.element_id, "new_number": records[(i + 1) % len(records)].number},
+                      f, ensure_ascii=False)
+        f.write("\n]\n")
+    return csv_path, json_path
+
+
+def peak_memory(func):
+    """Пиковый объем памяти Python (МБ), выделенной при вызове func"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / float(1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def apply_filters(model, queries):
+    """Применяет сочетания фильтров и строки поиска, возвращает число видимых листов"""
+    visible = 0
+    for filters, text in queries:
+        model.filters = dict(filters)
+        visible += len(model.set_search(text))
+    return visible
+
+
+def retained_memory(func):
+    """(результат func, объем памяти Python в МБ, который остается занят результатом)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0] / float(1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def shift_range_select(selection, clicks):
+    """Повторяет обработчики Click и PreviewMouseDown с зажатым Shift"""
+    selection.anchor = -1
+    for element_id in clicks:
+        if selection.can_select_range():
+            selection.select_range(element_id)
+        else:
+            selection.click(element_id, True)
+    return selection
+
+
+def renumber(doc, plan, log=None):
+    """Нумерация по плану внутри транзакции; изменения откатываются"""
+    numbers = dict((r.element_id, (r.number, r.key)) for r, _ in plan)
+    t = DB.Transaction(doc, "Нумерация листов")
+    t.Start()
+    try:
+        return apply_schedule(DB, doc, schedule(plan, NumberIndex.from_document(DB, doc)), log=log)
+    finally:
+        t.RollBack()
+        for r, _ in plan:
+            r.number, r.key = numbers[r.element_id]
+
+
+def renumber_chunked(doc, plan, cancel_after=None):
+    """
+    Нумерация частями в группе транзакций. Без отмены номера затем
+    возвращаются второй нумерацией; cancel_after - отмена после этого числа шагов.
+    Возвращает (результат первой нумерации, журнал).
+    """
+    numbers = dict((r.element_id, (r.number, r.key)) for r, _ in plan)
+    cancellation = Cancellation()
+
+    def progress(done, total):
+        if cancel_after is not None and done >= cancel_after:
+            cancellation.cancel()
+    log = RenumberLog()
+    result = commit_chunked(DB, doc, schedule(plan, NumberIndex.from_document(DB, doc)), log=log,
+                            progress=progress, cancellation=cancellation, sizer=ChunkSizer(initial=50))
+    if not result.cancelled:
+        back = [(r, numbers[r.element_id][0]) for r, _ in plan]
+        commit_chunked(DB, doc, schedule(back, NumberIndex.from_document(DB, doc)))
+    for r, _ in plan:
+        r.number, r.key = numbers[r.element_id]
+    return result, log
+
+
+# Модули, которые загружают узлы до показа окна (диалог) и до планирования (пакет)
+STARTUP_MODULES = {
+    "dialog": ["sheet_numbering.engine", "sheet_numbering.instrument", "sheet_numbering.cache",
+               "sheet_numbering.listmodel", "sheet_numbering.planner", "sheet_numbering.preview",
+               "sheet_numbering.template"],
+    "batch": ["sheet_numbering.engine", "sheet_numbering.instrument", "sheet_numbering.audit",
+              "sheet_numbering.batch", "sheet_numbering.cache", "sheet_numbering.template"],
+}
+
+# Запуск узла в новом процессе: первый запуск в сеансе (cold) загружает модули и
+# читает все листы, повторный (warm) берет модули и снимок из кэша сеанса
+STARTUP_PROBE = r"""
+import importlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+modules = json.loads(sys.argv[4])
+from sheet_numbering import standin as DB
+doc = DB.build_synthetic_document(int(sys.argv[2]), seed=int(sys.argv[3]))
+loaded = set(sys.modules)
+runs = []
+for _ in range(2):
+    started = time.perf_counter()
+    for name in modules:
+        importlib.import_module(name)
+    imported = time.perf_counter()
+    from sheet_numbering.cache import session_cache
+    from sheet_numbering.planner import NumberIndex
+    cache = session_cache()
+    cache.attach(DB, doc.Application)
+    snapshot = cache.snapshot(DB, doc, facet_params=("Текущая редакция",),
+                              search="sheet_numbering.listmodel" in modules)
+    if "sheet_numbering.listmodel" in modules:
+        from sheet_numbering.listmodel import SheetListModel
+        from sheet_numbering.preview import RenumberPreview
+        SheetListModel(snapshot)
+        RenumberPreview(snapshot, NumberIndex.from_records(snapshot.records, cache.placeholders(doc)))
+    else:
+        NumberIndex.from_document(DB, doc)
+    runs.append((imported - started, time.perf_counter() - started))
+print(json.dumps({"runs": runs, "modules": len(set(sys.modules) - loaded)}))
+"""
+
+
+def startup_phases(sheet_count, repeat, seed, record):
+    """Время до показа окна (диалог) и до планирования (пакет): первый и повторный запуск"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for mode, modules in sorted(STARTUP_MODULES.items()):
+        results = []
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, "-c", STARTUP_PROBE, root, str(sheet_count),
+                                              str(seed), json.dumps(modules)])
+            results.append(json.loads(output.decode("utf-8")))
+        for index, phase in enumerate(("startup_cold", "startup_warm")):
+            totals = [result["runs"][index][1] for result in results]
+            record("{0}_{1}".format(phase, mode), min(totals), sum(totals) / len(totals),
+                   import_seconds=round(min(result["runs"][index][0] for result in results), 6),
+                   modules=results[0]["modules"])
+
+
+def batch_phases(sheet_count, repeat, seed, record):
+    """Пакет из BATCH_DOCUMENTS документов: планы последовательно и в пуле, затем нумерация"""
+    docs = []
+    for i in range(BATCH_DOCUMENTS):
+        doc = DB.build_synthetic_document(sheet_count, seed=seed + i)
+        doc.Title = "Batch {0}".format(i)
+        docs.append(doc)
+    template = NumberTemplate("{section}.{n:03}", per_section=True)
+    jobs = [job_from_snapshot(i, doc.Title, take_snapshot(DB, doc), NumberIndex.from_document(DB, doc), template)
+            for i, doc in enumerate(docs)]
+    best, mean, serial = measure(lambda: plan_jobs(jobs, workers=1), repeat)
+    record("batch_plan_serial", best, mean, count=len(jobs))
+    best, mean, pooled = measure(lambda: plan_jobs(jobs), repeat)
+    mismatches = sum(1 for a, b in zip(serial, pooled) if (a.steps, a.conflicts) != (b.steps, b.conflicts))
+    record("batch_plan_pool", best, mean, count=len(jobs), workers=min(os.cpu_count() or 1, len(jobs)),
+           mismatches=mismatches)
+    # Нумерация изменяет документы, поэтому выполняется один раз
+    best, mean, result = measure(lambda: run_batch(DB, docs, template, workers=1), 1)
+    for document in result.documents:
+        if document["log"] and os.path.exists(document["log"]):
+            os.remove(document["log"])
+    summary = result.summary()
+    record("batch_run", best, mean, count=summary["sheets"], sheets_per_second=summary["sheets_per_second"],
+           errors=sum(document["error"] + document["conflict"] for document in result.documents))
+
+
+def run_size(sheet_count, repeat, seed):
+    """Замеры всех фаз для одного размера проекта"""
+    doc = DB.build_synthetic_document(sheet_count, seed=seed)
+    rng = random.Random(seed)
+    phases = []
+
+    def record(phase, best, mean, **extra):
+        entry = {"sheets": sheet_count, "phase": phase, "best": best, "mean": mean}
+        entry.update(extra)
+        phases.append(entry)
+
+    best, mean, sheets = measure(lambda: legacy_collect_sheets(doc), repeat)
+    record("collection_legacy", best, mean, count=len(sheets))
+
+    best, mean, sheets = measure(lambda: engine.collect_sheets(DB, doc), repeat)
+    record("collection", best, mean, count=len(sheets))
+
+    # Листы одного раздела: фильтр по параметру в коллекторе
+    # против чтения всех листов и отбора в Python
+    section = DB.SYNTHETIC_SECTIONS[0][0]
+    best, mean, section_snapshot = measure(lambda: take_snapshot(DB, doc, section=section), repeat)
+    record("collection_section", best, mean, count=len(section_snapshot))
+    best, mean, section_records = measure(lambda: engine.filter_records(
+        engine.read_sheet_records(DB, doc, legacy_collect_sheets(doc)), section), repeat)
+    record("collection_section_python", best, mean, count=len(section_records))
+
+    best, mean, snapshot = measure(
+        lambda: SheetSnapshot(engine.read_sheet_records(DB, doc, sheets)), repeat)
+    records = snapshot.records
+    record("extraction", best, mean, count=len(records))
+
+    shuffled = list(records)
+    rng.shuffle(shuffled)
+    best, mean, _ = measure(
+        lambda: sorted(shuffled, key=lambda r: SortKeyCache()(r.number)), repeat)
+    record("sorting", best, mean)
+
+    sort_key = SortKeyCache()
+    best, mean, _ = measure(lambda: sorted(shuffled, key=lambda r: sort_key(r.number)), repeat)
+    record("sorting_cached", best, mean)
+
+    index = SortedSheetIndex(records, sort_key, presorted=True)
+    moved = [rng.choice(records) for _ in range(min(100, len(records)))]
+
+    def reposition():
+        for r in moved:
+            old_number = r.number
+            r.number = old_number + "z"
+            index.reposition(r)
+            r.number = old_number
+            index.reposition(r)
+    best, mean, _ = measure(reposition, repeat)
+    record("sorted_index_update", best, mean, count=2 * len(moved))
+
+    best, mean, mismatches = measure(lambda: check_sort_keys(r.number for r in shuffled), 1)
+    record("sort_key_check", best, mean, mismatches=mismatches)
+
+    best, mean, values = measure(snapshot.section_values, repeat)
+    record("section_values", best, mean, count=len(values))
+
+    best, mean, _ = measure(lambda: SheetListModel(snapshot), repeat)
+    record("list_model", best, mean)
+
+    combo_values = [engine.ALL_VALUE] + values
+    best, mean, _ = measure(
+        lambda: [snapshot.filter(value) for value in combo_values], repeat)
+    record("filter_all_values", best, mean, count=len(combo_values))
+
+    # Фильтры по нескольким параметрам и поиск: пересечение множеств element_id
+    facet_params = [name for name, _ in DB.SYNTHETIC_FACETS]
+    best, mean, faceted = measure(lambda: take_snapshot(DB, doc, facet_params=facet_params, search=True), repeat)
+    record("collection_facets", best, mean, count=len(faceted.facets))
+    # Первый ввод в поиск: индекс уже построен при чтении листов
+    best, mean, _ = measure(lambda: faceted.search.search("лист 1"), repeat)
+    record("search_first", best, mean, count=len(faceted.search))
+    # Объем снимка в памяти (записи листов и индексы) на все время работы диалога
+    _, snapshot_mb = retained_memory(lambda: take_snapshot(DB, doc, facet_params=facet_params))
+    record("snapshot_memory", 0.0, 0.0, count=len(faceted), snapshot_mb=round(snapshot_mb, 2),
+           bytes_per_sheet=int(snapshot_mb * (1 << 20) / max(len(faceted), 1)))
+    best, mean, _ = measure(lambda: faceted.__setattr__("_search", None) or faceted.search, repeat)
+    record("search_index", best, mean, count=len(faceted.search.sorted_words))
+    facet_model = SheetListModel(faceted)
+    queries = [({}, "")]
+    for name, facet in sorted(faceted.facets.items()):
+        queries.append(({name: facet.value_list()[0]}, ""))
+    queries.append((dict((name, facet.value_list()[0]) for name, facet in faceted.facets.items()), ""))
+    queries.extend(({}, text) for text in ("л", "1", "12", "лист 1", "a 1"))
+    queries.append(({faceted.param_name: faceted.facets[faceted.param_name].value_list()[0]}, "1"))
+    best, mean, visible = measure(lambda: apply_filters(facet_model, queries), repeat)
+    record("facet_filter", best / len(queries), mean / len(queries), count=len(queries), visible=visible)
+    typing = [({}, "лист 12"[:length]) for length in range(1, 8)]
+    best, mean, visible = measure(lambda: apply_filters(facet_model, typing), repeat)
+    record("search_typing", best / len(typing), mean / len(typing), count=len(typing), visible=visible)
+
+    clicks = [rng.choice(records).element_id for _ in range(min(20, len(records)))]
+    selection = SelectionModel(records)
+    best, mean, _ = measure(lambda: shift_range_select(selection, clicks), repeat)
+    record("shift_range", best, mean, count=len(clicks))
+
+    # Предпросмотр: выбор всех листов, затем отдельные клики и смена префикса
+    template_a = NumberTemplate.from_prefix("A-")
+    template_b = NumberTemplate.from_prefix("B-")
+    preview = RenumberPreview(snapshot, NumberIndex.from_records(records), template_a)
+    all_ids = [r.element_id for r in records]
+    best, mean, _ = measure(lambda: (preview.selection_changed(all_ids, False),
+                                     preview.selection_changed(all_ids, True)), repeat)
+    record("preview_select_all", best, mean, count=len(preview))
+
+    def preview_clicks():
+        for element_id in clicks:
+            preview.selection_changed([element_id], False)
+            preview.selection_changed([element_id], True)
+    best, mean, _ = measure(preview_clicks, repeat)
+    record("preview_click", best, mean, count=2 * len(clicks))
+
+    best, mean, _ = measure(lambda: (preview.set_template(template_b), preview.set_template(template_a)), repeat)
+    record("preview_prefix", best, mean, count=2)
+
+    # Конфликты предпросмотра совпадают с планировщиком, включая цепочки ожидания:
+    # шаблоны "{n}" дают номера, уже занятые листами и заглушками документа
+    templates = [NumberTemplate.from_prefix(""), NumberTemplate("{n}", start=2),
+                 NumberTemplate("{n}", start=3, step=-1), NumberTemplate("{n:x}")]
+    best, mean, mismatches = measure(
+        lambda: preview_conflict_mismatches(snapshot, NumberIndex.from_document(DB, doc), templates,
+                                            random.Random(seed)), 1)
+    record("preview_conflicts", best, mean, count=len(templates), mismatches=mismatches)
+
+    # Формирование номеров: исходный цикл "префикс + номер" и скомпилированные шаблоны
+    best, mean, _ = measure(lambda: engine.plan_renumbering(records, 1, "АР-"), repeat)
+    record("numbers_prefix_loop", best, mean)
+    template = NumberTemplate.from_prefix("АР-")
+    best, mean, _ = measure(lambda: template.plan(records), repeat)
+    record("numbers_template", best, mean)
+    template = NumberTemplate("АР-{n:03}", step=10)
+    best, mean, _ = measure(lambda: template.plan(records), repeat)
+    record("numbers_template_padded", best, mean)
+    template = NumberTemplate("{section}.{n}", per_section=True)
+    best, mean, _ = measure(lambda: template.plan(records), repeat)
+    record("numbers_template_per_section", best, mean)
+
+    # Импорт соответствия номеров: потоковое чтение файла и сопоставление с листами
+    directory = tempfile.mkdtemp(prefix="sheet_numbering_")
+    try:
+        csv_path, json_path = write_mapping_files(directory, records)
+        for phase, path in (("import_csv", csv_path), ("import_json", json_path)):
+            best, mean, mapping = measure(lambda: import_mapping(snapshot, path), repeat)
+            record(phase, best, mean, count=len(mapping), errors=len(mapping.errors),
+                   peak_mb=round(peak_memory(lambda: import_mapping(snapshot, path)), 2))
+        best, mean, steps = measure(lambda: schedule(mapping.plan(mapping.records()), NumberIndex.from_records(records)), repeat)
+        record("import_schedule", best, mean, count=len(steps), errors=len(steps.conflicts))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    plan = engine.plan_renumbering(records, 1, "BENCH-")
+    best, mean, result = measure(lambda: renumber(doc, plan), repeat)
+    record("renumber", best, mean, count=len(result[0]), errors=len(result[1]))
+
+    # Журнал нумерации в файл: память не должна расти с числом листов
+    directory = tempfile.mkdtemp(prefix="sheet_numbering_")
+    try:
+        for phase, extension in (("renumber_log_jsonl", ".jsonl"), ("renumber_log_csv", ".csv")):
+            path = os.path.join(directory, "log" + extension)
+
+            def logged():
+                log = RenumberLog([open_log_writer(path)])
+                try:
+                    renumber(doc, plan, log)
+                finally:
+                    log.close()
+                return log
+            best, mean, log = measure(logged, repeat)
+            record(phase, best, mean, count=log.counts["renumbered"], errors=len(log.problems),
+                   log_kb=os.path.getsize(path) // 1024)
+        # Пиковая память: журнал в файл против накопления всех записей в памяти
+        record("renumber_log_memory", 0.0, 0.0,
+               log_peak_mb=round(peak_memory(logged), 2),
+               lines_peak_mb=round(peak_memory(lambda: renumber(doc, plan)), 2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # Сдвиг выбранных листов по кругу: каждый лист получает номер следующего,
+    # без планировщика каждое присваивание упирается в занятый номер.
+    # Временный номер цикла должен пройти проверку символов номера листа
+    rotation = [(r, records[(i + 1) % len(records)].number) for i, r in enumerate(records)]
+    best, mean, result = measure(lambda: renumber(doc, rotation), repeat)
+    record("renumber_rotation", best, mean, count=len(result[0]), errors=len(result[1]),
+           mismatches=len(result[1]) + len(rotation) - len(result[0]))
+
+    # Запись частями в группе транзакций (туда и обратно) и отмена на середине:
+    # после отмены номера документа и снимка должны совпасть с исходными
+    best, mean, (result, _) = measure(lambda: renumber_chunked(doc, plan), repeat)
+    record("renumber_chunked", best, mean, count=2 * result.done, chunks=len(result.chunks),
+           max_chunk=max(result.chunks) if result.chunks else 0)
+    cancel_snapshot = take_snapshot(DB, doc)
+    before = [(r.element_id, r.number) for r in cancel_snapshot.records]
+    cancel_plan = engine.plan_renumbering(cancel_snapshot.records, 1, "CANCEL-")
+    cancel_steps = schedule(cancel_plan, NumberIndex.from_document(DB, doc))
+    cancellation = Cancellation()
+    log = RenumberLog()
+    best = time.perf_counter()
+    result = commit_chunked(DB, doc, cancel_steps, cancel_snapshot, log,
+                            lambda done, total: done * 2 >= total and cancellation.cancel(), cancellation,
+                            ChunkSizer(initial=len(cancel_steps.steps) // 8, minimum=1))
+    best = time.perf_counter() - best
+    # Снимок после отката и документ (новый снимок) против исходных номеров
+    mismatches = log.counts["renumbered"]
+    for rows in (cancel_snapshot.records, take_snapshot(DB, doc).records):
+        rows = [(r.element_id, r.number) for r in rows]
+        mismatches += abs(len(rows) - len(before)) + sum(1 for a, b in zip(before, rows) if a != b)
+    record("renumber_cancel", best, best, count=result.done, cancelled=result.cancelled,
+           rolled_back=log.counts["rolled_back"], mismatches=mismatches)
+
+    # Замеры этапов: снимок и нумерация с выключенными и включенными замерами и трассировкой
+    def snapshot_and_renumber():
+        take_snapshot(DB, doc, facet_params=facet_params)
+        return renumber(doc, plan)
+    disabled_best, _, _ = measure(snapshot_and_renumber, repeat)
+    instrumentation = instrument.start(True, trace=True)
+    try:
+        best, mean, _ = measure(snapshot_and_renumber, repeat)
+    finally:
+        instrument.stop()
+    calls = instrumentation.calls
+    record("instrumentation", best, mean, overhead=round(best / disabled_best, 3) if disabled_best else 0.0,
+           phases=len(instrumentation.phases), events=len(instrumentation.events),
+           lookup_parameter=calls.get("LookupParameter", 0), sheet_number_set=calls.get("SheetNumber.set", 0))
+
+    batch_phases(sheet_count, repeat, seed, record)
+    startup_phases(sheet_count, repeat, seed, record)
+
+    # Повторные запуски: 5 наборов по 20 изменений, кэш снимков против полного чтения.
+    # Документ изменяется, поэтому фаза идет последней
+    change_sets = 5
+    refresh_time, full_time, mismatches = replay_changes(doc, change_sets, 20)
+    record("snapshot_cache_refresh", refresh_time / change_sets, refresh_time / change_sets,
+           count=change_sets, mismatches=mismatches)
+    record("snapshot_full_rescan", full_time / change_sets, full_time / change_sets, count=change_sets)
+
+    return phases
+
+
+def compare(results, baseline_path, threshold):
+    """Сравнивает лучшие времена с базовым запуском, возвращает список регрессий"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = dict(((r["sheets"], r["phase"]), r["best"]) for r in baseline["results"])
+    regressions = []
+    for r in results:
+        old = previous.get((r["sheets"], r["phase"]))
+        if old and r["best"] > old * threshold:
+            regressions.append((r["sheets"], r["phase"], old, r["best"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="JSON предыдущего запуска для поиска регрессий")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = []
+    for sheet_count in args.sizes:
+        for entry in run_size(sheet_count, args.repeat, args.seed):
+            print("{sheets:>7} {phase:<20} {best:10.6f}s".format(**entry))
+            results.append(entry)
+    mismatches = sum(r.get("mismatches", 0) for r in results)
+    if mismatches:
+        for r in results:
+            if r.get("mismatches"):
+                print("Расхождение с эталоном: {0} листов, {1}: {2}".format(r["sheets"], r["phase"], r["mismatches"]))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("Результаты записаны в {0}".format(args.output))
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for sheets, phase, old, new in regressions:
+            print("Регрессия: {0} листов, {1}: {2:.6f}s -> {3:.6f}s".format(sheets, phase, old, new))
+        return 1 if regressions or mismatches else 0
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Ядро нумерации листов, не зависящее от Revit.
+Содержит логику сортировки, фильтрации и построения плана нумерации,
+которую можно запускать и профилировать вне Dynamo.
+
+Имена пакета загружаются при первом обращении (from sheet_numbering import
+SheetSnapshot): импорт пакета или одного модуля (from sheet_numbering import
+engine) не загружает остальные модули, поэтому каждый узел загружает только
+то, что использует.
+"""
+
+import importlib
+
+# Имя -> модуль пакета, в котором оно определено
+_EXPORTS = {
+    # engine
+    'SECTION_PARAMETER': 'engine',
+    'ALL_VALUE': 'engine',
+    'EMPTY_VALUE': 'engine',
+    'SheetRecord': 'engine',
+    'element_id_value': 'engine',
+    'get_sheet_parameter_value': 'engine',
+    'sheet_collector': 'engine',
+    'section_filter': 'engine',
+    'iter_sheets': 'engine',
+    'collect_sheets': 'engine',
+    'read_sheet_records': 'engine',
+    'section_values': 'engine',
+    'filter_records': 'engine',
+    'parse_integer': 'engine',
+    'format_number': 'engine',
+    'plan_renumbering': 'engine',
+    'apply_plan': 'engine',
+    'format_result': 'engine',
+    # sorting
+    'natural_sort_key': 'sorting',
+    'compact_sort_key': 'sorting',
+    'SortKeyCache': 'sorting',
+    'SortedSheetIndex': 'sorting',
+    # facets
+    'FacetIndex': 'facets',
+    'SearchIndex': 'facets',
+    # snapshot
+    'SheetSnapshot': 'snapshot',
+    'take_snapshot': 'snapshot',
+    # cache
+    'SnapshotCache': 'cache',
+    'document_key': 'cache',
+    'document_version': 'cache',
+    'session_cache': 'cache',
+    # selection
+    'SelectionModel': 'selection',
+    # listmodel
+    'SheetRow': 'listmodel',
+    'SheetListModel': 'listmodel',
+    # audit
+    'RenumberEntry': 'audit',
+    'RenumberLog': 'audit',
+    'open_log_writer': 'audit',
+    'default_log_path': 'audit',
+    # planner
+    'NumberIndex': 'planner',
+    'RenumberStep': 'planner',
+    'RenumberSchedule': 'planner',
+    'schedule': 'planner',
+    'apply_schedule': 'planner',
+    # commit
+    'ChunkSizer': 'commit',
+    'Cancellation': 'commit',
+    'CommitResult': 'commit',
+    'commit_chunked': 'commit',
+    # preview
+    'RenumberPreview': 'preview',
+    # template
+    'NumberTemplate': 'template',
+    # importer
+    'MappingImport': 'importer',
+    'read_mapping': 'importer',
+    'import_mapping': 'importer',
+    # batch
+    'BatchJob': 'batch',
+    'BatchPlan': 'batch',
+    'BatchResult': 'batch',
+    'plan_jobs': 'batch',
+    'run_batch': 'batch',
+    'export_snapshot': 'batch',
+    'export_snapshots': 'batch',
+    # instrument
+    'Instrumentation': 'instrument',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+    value = getattr(importlib.import_module(__name__ + '.' + module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал нумерации: одна запись на каждый лист плана (element_id, старый
+и новый номер, статус, время записи номера). Записи передаются в файл
+(JSON Lines или CSV) по мере выполнения транзакции, в памяти остаются
+только счетчики по статусам и первые limit записей для выхода OUT,
+поэтому объем памяти не зависит от числа листов.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import time
+
+from sheet_numbering.engine import format_result
+
+# Статусы записей журнала
+STATUS_RENUMBERED = "renumbered"
+STATUS_UNCHANGED = "unchanged"
+STATUS_CONFLICT = "conflict"
+STATUS_ERROR = "error"
+# Номер был записан, но группа транзакций откачена (отмена или ошибка)
+STATUS_ROLLED_BACK = "rolled_back"
+STATUSES = (STATUS_RENUMBERED, STATUS_UNCHANGED, STATUS_CONFLICT, STATUS_ERROR, STATUS_ROLLED_BACK)
+
+# Поля записи в порядке колонок CSV
+FIELDS = ('element_id', 'old_number', 'new_number', 'status', 'message', 'seconds')
+# Сколько записей журнала попадает в выход OUT
+DEFAULT_LIMIT = 1000
+
+
+class RenumberEntry(object):
+    """Результат нумерации одного листа"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, element_id, old_number, new_number, status, message=None, seconds=0.0):
+        self.element_id = element_id
+        self.old_number = old_number
+        self.new_number = new_number
+        self.status = status
+        self.message = message
+        self.seconds = round(seconds, 6)
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in FIELDS)
+
+    def text(self):
+        """Строка отчета в прежнем текстовом формате"""
+        if self.status == STATUS_ERROR:
+            return "Ошибка при нумерации листа {0}: {1}".format(self.old_number, self.message)
+        if self.status == STATUS_CONFLICT:
+            return "Лист {0} не перенумерован: {1}".format(self.old_number, self.message)
+        if self.status == STATUS_ROLLED_BACK:
+            return "Нумерация листа {0} отменена".format(self.old_number)
+        return "Лист {0} -> {1}".format(self.old_number, self.new_number)
+
+
+class JsonLinesLogWriter(object):
+    """Журнал в формате JSON Lines: одна запись - одна строка"""
+
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self._file = io.open(path, 'w', encoding='utf-8', newline='\n')
+        self._count = 0
+
+    def write(self, entry):
+        self._file.write(json.dumps(entry.as_dict(), ensure_ascii=False) + '\n')
+        self._count += 1
+        if self._count % self.flush_every == 0:
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvLogWriter(JsonLinesLogWriter):
+    """Журнал в формате CSV (UTF-8 с BOM и ";" - открывается в Excel)"""
+
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self._file = io.open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file, delimiter=';')
+        self._writer.writerow(FIELDS)
+        self._count = 0
+
+    def write(self, entry):
+        self._writer.writerow([getattr(entry, field) for field in FIELDS])
+        self._count += 1
+        if self._count % self.flush_every == 0:
+            self._file.flush()
+
+
+def open_log_writer(path):
+    """Файл журнала: CSV для .csv, иначе JSON Lines"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return CsvLogWriter(path)
+    return JsonLinesLogWriter(path)
+
+
+def default_log_path(title, extension='.jsonl'):
+    """Путь журнала во временной папке: SheetNumbering/<документ>_<дата>_<время>.jsonl"""
+    name = re.sub(r'[^\w.-]+', '_', title or 'document').strip('_') or 'document'
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    return os.path.join(tempfile.gettempdir(), 'SheetNumbering', "{0}_{1}{2}".format(name, stamp, extension))
+
+
+class RenumberLog(object):
+    """
+    Приемник записей нумерации. Каждая запись сразу передается писателям
+    (writers), считается по статусу и, пока не набрано limit записей,
+    сохраняется для выхода OUT. Ошибки и конфликты сохраняются
+    отдельно, тоже не более limit. limit=None - хранить все.
+    """
+
+    def __init__(self, writers=(), limit=DEFAULT_LIMIT):
+        self.writers = list(writers)
+        self.limit = limit
+        self.counts = dict((status, 0) for status in STATUSES)
+        self.entries = []
+        self.problems = []
+        self.seconds = 0.0
+        self._started = time.perf_counter()
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def add(self, entry):
+        self.counts[entry.status] += 1
+        for writer in self.writers:
+            writer.write(entry)
+        limit = self.limit
+        if limit is None or len(self.entries) < limit:
+            self.entries.append(entry)
+        if entry.status in (STATUS_ERROR, STATUS_CONFLICT) and (limit is None or len(self.problems) < limit):
+            self.problems.append(entry)
+
+    def roll_back(self, entries):
+        """
+        Отмечает откат перенумерованных листов: записи entries (статус rolled_back)
+        пишутся в журнал, счетчик и сохраненные записи этих листов меняют статус.
+        """
+        rolled_back = set()
+        for entry in entries:
+            rolled_back.add(entry.element_id)
+            for writer in self.writers:
+                writer.write(entry)
+        self.counts[STATUS_RENUMBERED] -= len(rolled_back)
+        self.counts[STATUS_ROLLED_BACK] += len(rolled_back)
+        for entry in self.entries:
+            if entry.status == STATUS_RENUMBERED and entry.element_id in rolled_back:
+                entry.status = STATUS_ROLLED_BACK
+
+    def close(self):
+        self.seconds = time.perf_counter() - self._started
+        for writer in self.writers:
+            writer.close()
+
+    def renumbered_lines(self):
+        """Строки "Лист X -> Y" сохраненных записей"""
+        return [entry.text() for entry in self.entries if entry.status == STATUS_RENUMBERED]
+
+    def error_lines(self):
+        """Строки ошибок и конфликтов сохраненных записей"""
+        return [entry.text() for entry in self.problems]
+
+    def summary(self):
+        summary = dict(self.counts)
+        summary['total'] = len(self)
+        summary['seconds'] = round(self.seconds, 3)
+        return summary
+
+    def report(self, start_number=None, prefix='', extra_errors=()):
+        """Текстовый отчет, как engine.format_result, с полными счетчиками"""
+        errors = self.error_lines()
+        error_count = self.counts[STATUS_ERROR] + self.counts[STATUS_CONFLICT]
+        if error_count > len(errors):
+            errors.append("... и еще {0} ошибок".format(error_count - len(errors)))
+        errors.extend(extra_errors)
+        return format_result(self.renumbered_lines(), errors, start_number, prefix,
+                             renumbered_count=self.counts[STATUS_RENUMBERED])
+
+    def output(self, report, path=None, **extra):
+        """Структурированный результат для выхода OUT узла Dynamo"""
+        result = {
+            'report': report,
+            'summary': self.summary(),
+            'log': path,
+            'sheets': [entry.as_dict() for entry in self.entries],
+        }
+        result.update(extra)
+        return result
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная нумерация листов нескольких документов.
+Планирование (шаблон номеров и порядок записи без конфликтов) - чистый
+Python, поэтому планы всех документов строятся параллельно в пуле
+процессов. В процесс передаются только данные листов (BatchJob), без
+элементов Revit. Затем планы выполняются по очереди, каждый документ -
+в своей транзакции.
+
+Вместо открытого документа можно передать снимок, выгруженный
+export_snapshots() (в узле пакетной нумерации - вход IN[6]): для него
+строится только план, который записывается рядом со снимком в виде файла
+соответствия для импорта в диалоге. Внутри Revit пул процессов недоступен
+(см. can_use_processes), поэтому снимки планируются в пуле при запуске
+вне Revit:
+    python -m sheet_numbering.batch A.json B.json --template "АР-{n:03}"
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+
+from sheet_numbering.audit import RenumberLog, default_log_path, open_log_writer
+from sheet_numbering.engine import SECTION_PARAMETER, ALL_VALUE, SheetRecord
+from sheet_numbering.instrument import current
+from sheet_numbering.planner import NumberIndex, RenumberSchedule, RenumberStep, schedule, apply_schedule
+from sheet_numbering.template import NumberTemplate
+
+# Статусы документов в результате пакета
+STATUS_DONE = "done"
+STATUS_PLANNED = "planned"
+STATUS_SKIPPED = "skipped"
+STATUS_FAILED = "failed"
+
+
+class BatchJob(object):
+    """
+    Данные для планирования одного документа: записи листов
+    (element_id, номер, имя, раздел), номера всех листов документа
+    (включая заглушки) и параметры шаблона (текст, начало, шаг, по разделам).
+    """
+
+    def __init__(self, key, title, sheets, numbers, template):
+        self.key = key
+        self.title = title
+        self.sheets = sheets
+        self.numbers = numbers
+        self.template = template
+
+
+class BatchPlan(object):
+    """
+    Результат планирования: шаги (element_id, номер, временный),
+    конфликты (element_id, новый номер, причина), element_id листов
+    с неизменным номером и время планирования.
+    """
+
+    def __init__(self, key, steps, conflicts, unchanged, cycles, seconds):
+        self.key = key
+        self.steps = steps
+        self.conflicts = conflicts
+        self.unchanged = unchanged
+        self.cycles = cycles
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.steps)
+
+    def to_schedule(self, records_by_id):
+        """RenumberSchedule для записей снимка (с элементами Revit)"""
+        result = RenumberSchedule()
+        result.steps = [RenumberStep(records_by_id[i], number, temporary) for i, number, temporary in self.steps]
+        result.conflicts = [(records_by_id[i], number, reason) for i, number, reason in self.conflicts]
+        result.unchanged = [records_by_id[i] for i in self.unchanged]
+        result.cycles = self.cycles
+        return result
+
+
+def template_spec(template):
+    """Параметры шаблона для передачи в другой процесс"""
+    return template.text, template.start, template.step, template.per_section
+
+
+def job_from_snapshot(key, title, snapshot, numbers, template, section=ALL_VALUE):
+    """BatchJob по снимку листов и NumberIndex документа"""
+    sheets = [(r.element_id, r.number, r.name, r.section) for r in snapshot.filter(section)]
+    return BatchJob(key, title, sheets, dict(numbers.holders), template_spec(template))
+
+
+def plan_job(job):
+    """Строит план для BatchJob. Выполняется в процессе пула"""
+    started = time.perf_counter()
+    records = [SheetRecord(*sheet) for sheet in job.sheets]
+    result = schedule(NumberTemplate(*job.template).plan(records), NumberIndex(job.numbers))
+    return BatchPlan(
+        job.key,
+        [(step.record.element_id, step.number, step.temporary) for step in result.steps],
+        [(record.element_id, number, reason) for record, number, reason in result.conflicts],
+        [record.element_id for record in result.unchanged],
+        result.cycles,
+        time.perf_counter() - started)
+
+
+def can_use_processes():
+    """
+    Пул процессов запускает копии sys.executable. Внутри Revit это Revit.exe,
+    а не интерпретатор Python, поэтому пул доступен только во внешнем Python.
+    """
+    executable = os.path.basename(sys.executable or '').lower()
+    return executable.startswith('python')
+
+
+def plan_jobs(jobs, workers=None):
+    """
+    Планы для всех заданий в исходном порядке. При workers > 1 и нескольких
+    заданиях планы строятся в пуле процессов, иначе - последовательно.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers > 1 and can_use_processes():
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(plan_job, jobs))
+    return [plan_job(job) for job in jobs]
+
+
+def export_snapshot(snapshot, numbers, path, title=""):
+    """Записывает снимок листов и номера документа в JSON для пакетного планирования"""
+    data = {
+        'title': title,
+        'param_name': snapshot.param_name,
+        'sheets': [[r.element_id, r.number, r.name, r.section] for r in snapshot.records],
+        'numbers': numbers.holders,
+    }
+    with io.open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def document_snapshot(DB, doc, cache=None, param_name=SECTION_PARAMETER):
+    """Снимок листов документа из кэша сеанса или прочитанный заново"""
+    if cache is not None:
+        return cache.snapshot(DB, doc, param_name)
+    from sheet_numbering.snapshot import take_snapshot
+    return take_snapshot(DB, doc, param_name)
+
+
+def export_snapshots(DB, docs, directory, cache=None, param_name=SECTION_PARAMETER):
+    """
+    Выгружает снимки листов документов в папку directory (<документ>.json)
+    для планирования вне Revit. Возвращает пути файлов; связанные
+    документы и документы семейств пропускаются.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = []
+    for doc in docs:
+        if hasattr(doc, 'InternalDocument'):
+            doc = doc.InternalDocument
+        if getattr(doc, 'IsLinked', False) or getattr(doc, 'IsFamilyDocument', False):
+            continue
+        name = re.sub(r'[^\w.-]+', '_', doc.Title or 'document').strip('_') or 'document'
+        path = os.path.join(directory, name + '.json')
+        export_snapshot(document_snapshot(DB, doc, cache, param_name), NumberIndex.from_document(DB, doc),
+                        path, doc.Title)
+        paths.append(path)
+    return paths
+
+
+def load_snapshot_job(path, template, section=ALL_VALUE):
+    """BatchJob из снимка, выгруженного export_snapshot()"""
+    with io.open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    sheets = [tuple(sheet) for sheet in data['sheets']]
+    if section != ALL_VALUE:
+        from sheet_numbering.engine import filter_records
+        records = filter_records([SheetRecord(*sheet) for sheet in sheets], section)
+        sheets = [(r.element_id, r.number, r.name, r.section) for r in records]
+    return BatchJob(path, data.get('title') or os.path.basename(path), sheets, data['numbers'],
+                    template_spec(template))
+
+
+def write_plan_mapping(plan, job, path):
+    """Файл соответствия (element_id;номер;новый номер) для импорта в диалоге"""
+    numbers = dict((sheet[0], sheet[1]) for sheet in job.sheets)
+    with io.open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(('element_id', 'number', 'new_number'))
+        for element_id, number, temporary in plan.steps:
+            if not temporary:
+                writer.writerow((element_id, numbers[element_id], number))
+
+
+def skip_reason(doc):
+    """Причина, по которой документ не нумеруется, или None"""
+    if getattr(doc, 'IsLinked', False):
+        return "связанный документ"
+    if getattr(doc, 'IsFamilyDocument', False):
+        return "документ семейства"
+    if getattr(doc, 'IsReadOnly', False):
+        return "документ открыт только для чтения"
+    return None
+
+
+class BatchResult(object):
+    """Результаты документов пакета и общая пропускная способность"""
+
+    def __init__(self):
+        self.documents = []
+        self.plan_seconds = 0.0
+        self.apply_seconds = 0.0
+        self.seconds = 0.0
+
+    def add(self, title, status, sheets=0, log=None, plan=None, message=None, path=None, apply_seconds=0.0):
+        entry = {
+            'title': title,
+            'status': status,
+            'sheets': sheets,
+            'plan_seconds': round(plan.seconds, 3) if plan is not None else 0.0,
+            'apply_seconds': round(apply_seconds, 3),
+            'cycles': plan.cycles if plan is not None else 0,
+            'message': message,
+            'log': path,
+        }
+        if log is not None:
+            entry.update(log.counts)
+        elif plan is not None:
+            entry['planned'] = sum(1 for step in plan.steps if not step[2])
+            entry['conflict'] = len(plan.conflicts)
+        self.documents.append(entry)
+        return entry
+
+    def summary(self):
+        sheets = sum(document['sheets'] for document in self.documents)
+        return {
+            'documents': len(self.documents),
+            'sheets': sheets,
+            'seconds': round(self.seconds, 3),
+            'plan_seconds': round(self.plan_seconds, 3),
+            'apply_seconds': round(self.apply_seconds, 3),
+            'sheets_per_second': round(sheets / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+    def output(self):
+        """Структурированный результат для выхода OUT узла Dynamo"""
+        return {'summary': self.summary(), 'documents': self.documents}
+
+
+def run_batch(DB, sources, template, cache=None, section=ALL_VALUE, workers=None,
+              param_name=SECTION_PARAMETER, log_extension='.jsonl', transaction_name="Нумерация листов"):
+    """
+    Нумерует листы документов sources (Document или путь к выгруженному снимку).
+    Если в sources только пути к снимкам, DB не используется (можно передать None).
+    Связанные документы, документы семейств и документы только для чтения пропускаются.
+    cache - SnapshotCache для повторного использования снимков открытых документов.
+    """
+    started = time.perf_counter()
+    result = BatchResult()
+    jobs = []  # BatchJob или None для пропущенного документа
+    targets = []  # (документ или None, снимок или None, причина пропуска)
+    for source in sources:
+        if isinstance(source, str):
+            jobs.append(load_snapshot_job(source, template, section))
+            targets.append((None, None, None))
+            continue
+        if hasattr(source, 'InternalDocument'):
+            # Документ Dynamo (Revit.Application.Document) - берем документ Revit
+            source = source.InternalDocument
+        reason = skip_reason(source)
+        if reason is not None:
+            jobs.append(None)
+            targets.append((source, None, reason))
+            continue
+        snapshot = document_snapshot(DB, source, cache, param_name)
+        jobs.append(job_from_snapshot(len(jobs), source.Title, snapshot,
+                                      NumberIndex.from_document(DB, source), template, section))
+        targets.append((source, snapshot, None))
+
+    instrumentation = current()
+    plan_started = time.perf_counter()
+    plans = iter(plan_jobs([job for job in jobs if job is not None], workers))
+    result.plan_seconds = time.perf_counter() - plan_started
+    instrumentation.add('batch_plan', result.plan_seconds, plan_started)
+
+    for job, (doc, snapshot, reason) in zip(jobs, targets):
+        if job is None:
+            result.add(doc.Title, STATUS_SKIPPED, message=reason)
+            continue
+        plan = next(plans)
+        if doc is None:
+            path = os.path.splitext(job.key)[0] + '.plan.csv'
+            write_plan_mapping(plan, job, path)
+            result.add(job.title, STATUS_PLANNED, len(job.sheets), plan=plan, path=path)
+            continue
+        apply_started = time.perf_counter()
+        path = default_log_path(doc.Title, log_extension)
+        log = RenumberLog([open_log_writer(path)])
+        t = DB.Transaction(doc, transaction_name)
+        try:
+            t.Start()
+            apply_schedule(DB, doc, plan.to_schedule(snapshot.by_id), snapshot, log)
+            with instrumentation.phase('commit'):
+                t.Commit()
+            status, message = STATUS_DONE, None
+        except Exception as e:
+            if t.HasStarted():
+                t.RollBack()
+            if cache is not None:
+                cache.invalidate(doc)
+            status, message = STATUS_FAILED, str(e)
+        finally:
+            log.close()
+        apply_seconds = time.perf_counter() - apply_started
+        result.apply_seconds += apply_seconds
+        result.add(job.title, status, len(job.sheets), log, plan, message, path, apply_seconds)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def main(argv=None):
+    """Планы нумерации выгруженных снимков вне Revit (в пуле процессов)"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Планы нумерации для снимков листов, выгруженных export_snapshots")
+    parser.add_argument("snapshots", nargs="+", help="файлы снимков .json")
+    parser.add_argument("--template", required=True, help='шаблон номера или префикс, например "АР-{n:03}"')
+    parser.add_argument("--start", type=int, default=1)
+    parser.add_argument("--step", type=int, default=1)
+    parser.add_argument("--per-section", action="store_true", help="счет заново в каждом разделе")
+    parser.add_argument("--section", default=ALL_VALUE, help="нумеровать только листы раздела")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию - число ядер)")
+    args = parser.parse_args(argv)
+    template = NumberTemplate.parse(args.template, args.start, args.step, args.per_section)
+    result = run_batch(None, args.snapshots, template, section=args.section, workers=args.workers)
+    print(json.dumps(result.output(), ensure_ascii=False, indent=2))
+    return 1 if any(document['status'] == STATUS_FAILED for document in result.documents) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
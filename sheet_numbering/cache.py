@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш снимков листов между запусками узла.
+Модуль импортируется один раз за сеанс Revit, поэтому кэш переживает
+повторные запуски скрипта. Снимок хранится для каждого открытого
+документа; изменения листов отслеживаются событием DocumentChanged,
+и при следующем запуске перечитываются только измененные листы.
+Снимок строится заново, если документ еще не отслеживался, если
+изменилась версия документа (сохранение, синхронизация с хранилищем)
+или если он был сброшен после отката транзакции.
+Вместе со снимком хранятся номера заглушек листов: вместе с записями
+снимка они дают индекс всех номеров документа без повторного перебора.
+
+Кэш хранится только в памяти. Записи содержат лишь element_id и значения
+параметров, но изменения, внесенные вне сеанса, событиями не отслеживаются,
+поэтому в новом сеансе листы читаются заново.
+"""
+
+from collections import OrderedDict
+
+from sheet_numbering.engine import SECTION_PARAMETER, element_id_value, read_sheet_records
+from sheet_numbering.instrument import current
+from sheet_numbering.snapshot import take_snapshot
+
+# Сколько документов хранится в кэше одновременно
+DEFAULT_CAPACITY = 4
+
+
+def document_key(doc):
+    """Ключ документа: путь к файлу, для несохраненных - заголовок"""
+    return doc.PathName or doc.Title
+
+
+def document_version(DB, doc):
+    """Версия документа (Revit 2021+) или None, если ее нельзя получить"""
+    get_version = getattr(DB.Document, 'GetDocumentVersion', None)
+    if get_version is None:
+        return None
+    try:
+        version = get_version(doc)
+        return str(version.VersionGUID), version.NumberOfSaves
+    except Exception:
+        return None
+
+
+class _CacheEntry(object):
+    """Снимок документа, номера заглушек и изменения, накопленные после его построения"""
+
+    __slots__ = ('snapshot', 'placeholders', 'version', 'changed', 'deleted')
+
+    def __init__(self, snapshot, placeholders, version):
+        self.snapshot = snapshot
+        self.placeholders = placeholders  # element_id заглушки -> номер
+        self.version = version
+        self.changed = set()  # element_id измененных и добавленных листов
+        self.deleted = set()  # element_id удаленных элементов
+
+
+class SnapshotCache(object):
+    """
+    Снимки листов по документам с вытеснением давно не использованных.
+    Изменения передаются через changed() - из обработчика DocumentChanged
+    (см. attach) или напрямую при воспроизведении наборов изменений.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._entries = OrderedDict()  # Ключ документа -> _CacheEntry
+        self._applications = []
+        self._sheet_filter = None
+        self.full_scans = 0
+        self.refreshes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, doc):
+        return document_key(doc) in self._entries
+
+    def attach(self, DB, application):
+        """Подписывается на события приложения (один раз на приложение)"""
+        if application in self._applications:
+            return
+        self._sheet_filter = DB.ElementCategoryFilter(DB.BuiltInCategory.OST_Sheets)
+        application.DocumentChanged += self._document_changed
+        application.DocumentClosing += self._document_closing
+        self._applications.append(application)
+
+    def detach(self):
+        for application in self._applications:
+            application.DocumentChanged -= self._document_changed
+            application.DocumentClosing -= self._document_closing
+        self._applications = []
+
+    def _document_changed(self, sender, args):
+        # Изменения документов без снимка не нужны - id не перебираются
+        doc = args.GetDocument()
+        if document_key(doc) not in self._entries:
+            return
+        sheet_filter = self._sheet_filter
+        changed = [element_id_value(i) for i in args.GetModifiedElementIds(sheet_filter)]
+        changed.extend(element_id_value(i) for i in args.GetAddedElementIds(sheet_filter))
+        deleted = [element_id_value(i) for i in args.GetDeletedElementIds()]
+        self.changed(doc, changed, deleted)
+
+    def _document_closing(self, sender, args):
+        self.invalidate(args.Document)
+
+    def changed(self, doc, changed_ids, deleted_ids=()):
+        """Запоминает element_id измененных и удаленных листов документа"""
+        entry = self._entries.get(document_key(doc))
+        if entry is None:
+            return
+        entry.changed.update(changed_ids)
+        entry.changed.difference_update(deleted_ids)
+        entry.deleted.update(deleted_ids)
+
+    def invalidate(self, doc):
+        """Сбрасывает снимок документа: следующий запуск прочитает все листы"""
+        self._entries.pop(document_key(doc), None)
+
+    def snapshot(self, DB, doc, param_name=SECTION_PARAMETER, facet_params=(), search=False):
+        """
+        Снимок листов документа: из кэша с применением накопленных
+        изменений или построенный заново. search - индекс поиска строится
+        сразу (в снимке из кэша он обновляется вместе с записями).
+        """
+        key = document_key(doc)
+        version = document_version(DB, doc)
+        entry = self._entries.get(key)
+        facet_params = tuple(name for name in facet_params if name != param_name)
+        if (entry is None or not self._applications or entry.version != version
+                or entry.snapshot.param_name != param_name or entry.snapshot.facet_params != facet_params):
+            with current().phase('snapshot'):
+                placeholders = {}
+                entry = _CacheEntry(take_snapshot(DB, doc, param_name, facet_params=facet_params,
+                                                  placeholders=placeholders, search=search),
+                                    placeholders, version)
+            self._entries[key] = entry
+            self.full_scans += 1
+        elif entry.changed or entry.deleted:
+            with current().phase('snapshot_refresh'):
+                self._refresh(DB, doc, entry)
+            self.refreshes += 1
+        if search:
+            # Снимок из кэша, построенный без индекса поиска
+            entry.snapshot.search
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return entry.snapshot
+
+    def placeholders(self, doc):
+        """
+        Номера заглушек листов (element_id -> номер) на момент последнего
+        вызова snapshot() или None, если документа нет в кэше
+        """
+        entry = self._entries.get(document_key(doc))
+        return entry.placeholders if entry is not None else None
+
+    def _refresh(self, DB, doc, entry):
+        """Перечитывает измененные листы и убирает удаленные"""
+        snapshot = entry.snapshot
+        placeholders = entry.placeholders
+        for element_id in entry.deleted:
+            placeholders.pop(element_id, None)
+            record = snapshot.get(element_id)
+            if record is not None:
+                snapshot.remove(record)
+        sheets = []
+        for element_id in entry.changed:
+            placeholders.pop(element_id, None)
+            record = snapshot.get(element_id)
+            if record is not None:
+                snapshot.remove(record)
+            sheet = doc.GetElement(DB.ElementId(element_id))
+            if sheet is None or not isinstance(sheet, DB.ViewSheet):
+                continue
+            if sheet.IsPlaceholder:
+                placeholders[element_id] = sheet.SheetNumber
+            else:
+                sheets.append(sheet)
+        current().count('GetElement', len(entry.changed))
+        for record in read_sheet_records(DB, doc, sheets, snapshot.param_name, snapshot.sort_key,
+                                         snapshot.facet_params):
+            snapshot.add(record)
+        entry.changed = set()
+        entry.deleted = set()
+
+
+# Кэш текущего сеанса Revit
+_session_cache = None
+
+
+def session_cache():
+    """Кэш снимков, общий для всех запусков скрипта в сеансе"""
+    global _session_cache
+    if _session_cache is None:
+        _session_cache = SnapshotCache()
+    return _session_cache
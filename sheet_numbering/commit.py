@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Запись номеров частями внутри группы транзакций.
+План выполняется в TransactionGroup, каждая часть шагов - в своей
+транзакции. После каждой части вызывается обработчик хода выполнения
+(индикатор в окне), затем проверяется запрос на отмену. При отмене
+или ошибке группа откатывается целиком: номера листов в документе
+и в снимке остаются прежними, а в журнал пишется откат. Иначе группа
+объединяется (Assimilate) в одну операцию отмены Revit.
+
+Размер части подбирается по измеренной скорости записи: часть должна
+выполняться около CHUNK_SECONDS, чтобы индикатор обновлялся и отмена
+срабатывала быстро, а подтверждений транзакций (с регенерацией модели)
+было немного.
+"""
+
+import time
+
+from sheet_numbering.audit import STATUS_ROLLED_BACK, RenumberEntry, RenumberLog
+from sheet_numbering.instrument import current
+from sheet_numbering.planner import write_steps, log_skipped
+
+# Желаемое время записи одной части, с
+CHUNK_SECONDS = 0.25
+# Размер первой части и границы размера
+INITIAL_CHUNK = 100
+MIN_CHUNK = 10
+MAX_CHUNK = 5000
+# Во сколько раз часть может вырасти за один шаг
+MAX_GROWTH = 4
+
+
+class ChunkSizer(object):
+    """
+    Размер следующей части по скорости записи предыдущих
+    (экспоненциальное скользящее среднее шагов в секунду).
+    """
+
+    def __init__(self, target_seconds=CHUNK_SECONDS, initial=INITIAL_CHUNK, minimum=MIN_CHUNK,
+                 maximum=MAX_CHUNK, smoothing=0.5):
+        self.target_seconds = target_seconds
+        self.minimum = minimum
+        self.maximum = maximum
+        self.smoothing = smoothing
+        self.size = max(minimum, min(maximum, initial))
+        self.rate = None  # Шагов в секунду
+
+    def record(self, steps, seconds):
+        """Учитывает время записи части из steps шагов"""
+        if steps <= 0 or seconds <= 0:
+            return
+        rate = steps / seconds
+        self.rate = rate if self.rate is None else self.rate + self.smoothing * (rate - self.rate)
+        size = min(int(self.rate * self.target_seconds), self.size * MAX_GROWTH)
+        self.size = max(self.minimum, min(self.maximum, size))
+
+
+class Cancellation(object):
+    """Запрос на отмену: устанавливается из окна хода выполнения, проверяется между частями"""
+
+    def __init__(self):
+        self.requested = False
+
+    def cancel(self):
+        self.requested = True
+
+
+class CommitResult(object):
+    """Итог записи: число частей, их размеры, отмена и время"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.chunks = []  # Размеры выполненных частей
+        self.cancelled = False
+        self.seconds = 0.0
+
+    def output(self):
+        """Раздел для выхода OUT узла Dynamo"""
+        return {
+            'steps': self.total,
+            'done': self.done,
+            'cancelled': self.cancelled,
+            'chunks': len(self.chunks),
+            'max_chunk': max(self.chunks) if self.chunks else 0,
+            'seconds': round(self.seconds, 3),
+            'steps_per_second': round(self.done / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+def roll_back_written(written, snapshot, log):
+    """Возвращает прежние номера записям (и снимку) после отката группы и отмечает откат в журнале"""
+    for record, old_number, new_number in reversed(written):
+        if snapshot is not None:
+            snapshot.renumber(record, old_number)
+        else:
+            record.number = old_number
+            record.key = None
+    log.roll_back(RenumberEntry(record.element_id, old_number, new_number, STATUS_ROLLED_BACK,
+                                "группа транзакций откачена")
+                  for record, old_number, new_number in written)
+
+
+def commit_chunked(DB, doc, schedule_result, snapshot=None, log=None, progress=None, cancellation=None,
+                   sizer=None, transaction_name="Нумерация листов"):
+    """
+    Выполняет план частями в группе транзакций. Транзакция документа
+    не должна быть открыта. progress(выполнено шагов, всего шагов)
+    вызывается после каждой части; cancellation - Cancellation.
+    Возвращает CommitResult; при ошибке группа откатывается и исключение
+    передается дальше.
+    """
+    if log is None:
+        log = RenumberLog(limit=None)
+    if sizer is None:
+        sizer = ChunkSizer()
+    instrumentation = current()
+    perf_counter = time.perf_counter
+    steps = schedule_result.steps
+    result = CommitResult(len(steps))
+    started = perf_counter()
+    original_numbers = {}
+    written = []  # (запись, исходный номер, новый номер) для отката
+    writes = 0
+    group = DB.TransactionGroup(doc, transaction_name)
+    group.Start()
+    try:
+        while result.done < len(steps):
+            if cancellation is not None and cancellation.requested:
+                result.cancelled = True
+                break
+            chunk = steps[result.done:result.done + sizer.size]
+            chunk_started = perf_counter()
+            t = DB.Transaction(doc, transaction_name)
+            t.Start()
+            try:
+                with instrumentation.phase('apply'):
+                    writes += write_steps(DB, doc, chunk, snapshot, log, original_numbers, written)
+                with instrumentation.phase('commit'):
+                    t.Commit()
+            except Exception:
+                if t.HasStarted():
+                    t.RollBack()
+                raise
+            sizer.record(len(chunk), perf_counter() - chunk_started)
+            result.chunks.append(len(chunk))
+            result.done += len(chunk)
+            if progress is not None:
+                progress(result.done, len(steps))
+        if result.cancelled:
+            with instrumentation.phase('rollback'):
+                group.RollBack()
+            roll_back_written(written, snapshot, log)
+            del written[:]
+        else:
+            log_skipped(schedule_result, log)
+            group.Assimilate()
+    except Exception:
+        if group.HasStarted():
+            group.RollBack()
+        roll_back_written(written, snapshot, log)
+        raise
+    finally:
+        result.seconds = perf_counter() - started
+        instrumentation.count('GetElement', result.done)
+        instrumentation.count('SheetNumber.set', writes)
+    return result
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Логика нумерации листов без привязки к Revit.
+Функции, которым нужны типы Revit API, принимают пространство имен DB
+(Autodesk.Revit.DB или sheet_numbering.standin) первым аргументом.
+"""
+
+import time
+from sys import intern
+
+from sheet_numbering.instrument import current
+from sheet_numbering.sorting import natural_sort_key, compact_sort_key
+
+# Параметр, по которому фильтруются листы
+SECTION_PARAMETER = "ADSK_Штамп Раздел проекта"
+# Служебные значения фильтра
+ALL_VALUE = "Все"
+EMPTY_VALUE = "(Без значения)"
+
+
+class SheetRecord(object):
+    """
+    Снимок данных листа, нужных для фильтрации и нумерации.
+    Элемент Revit в записи не хранится: лист запрашивается по element_id
+    только при записи номеров (get_sheet_element).
+    """
+
+    __slots__ = ('element_id', 'number', 'name', 'section', 'values', 'key')
+
+    def __init__(self, element_id, number, name, section, values=(), key=None):
+        self.element_id = element_id
+        self.number = number
+        self.name = name
+        self.section = section
+        self.values = values  # Значения параметров фильтров (SheetSnapshot.facet_params)
+        self.key = key  # Ключ сортировки номера, заполняется при чтении или в SortedSheetIndex
+
+    def __repr__(self):
+        return "SheetRecord({0!r}, {1!r}, {2!r}, {3!r})".format(
+            self.element_id, self.number, self.name, self.section)
+
+
+def element_id_value(element_id):
+    """Целое значение ElementId (Value в Revit 2024+, IntegerValue в старых версиях)"""
+    value = getattr(element_id, 'Value', None)
+    if value is None:
+        value = element_id.IntegerValue
+    return int(value)
+
+
+def get_sheet_element(DB, doc, element_id):
+    """Лист документа по целому ElementId или None"""
+    return doc.GetElement(DB.ElementId(element_id))
+
+
+# Функция для получения значения параметра из листа
+def get_sheet_parameter_value(DB, doc, sheet, param_name, element_names=None):
+    """
+    Получает значение параметра из листа по имени.
+    element_names - необязательный словарь {id: имя} для кэширования
+    имен элементов, на которые ссылаются параметры типа ElementId.
+    """
+    try:
+        param = sheet.LookupParameter(param_name)
+        if param is not None:
+            storage_type = param.StorageType
+            if storage_type == DB.StorageType.String:
+                value = param.AsString()
+            elif storage_type == DB.StorageType.Integer:
+                value = param.AsInteger()
+            elif storage_type == DB.StorageType.Double:
+                value = param.AsDouble()
+            elif storage_type == DB.StorageType.ElementId:
+                elem_id = param.AsElementId()
+                id_value = element_id_value(elem_id)
+                if id_value < 0:
+                    value = None
+                elif element_names is not None and id_value in element_names:
+                    value = element_names[id_value]
+                else:
+                    current().count('GetElement')
+                    elem = doc.GetElement(elem_id)
+                    value = elem.Name if elem else None
+                    if element_names is not None:
+                        element_names[id_value] = value
+            else:
+                value = param.AsValueString()
+            return value if value is not None else ""
+        return ""
+    except:
+        return ""
+
+
+def sheet_collector(DB, doc):
+    """
+    Коллектор всех листов документа, включая заглушки. Категория и класс
+    проверяются быстрыми фильтрами на стороне Revit.
+    """
+    return (DB.FilteredElementCollector(doc)
+            .OfCategory(DB.BuiltInCategory.OST_Sheets)
+            .WhereElementIsNotElementType()
+            .OfClass(DB.ViewSheet))
+
+
+def section_filter(DB, doc, section, param_name=SECTION_PARAMETER):
+    """
+    Фильтр Revit по значению параметра раздела или None, если отбирать
+    листы нужно в Python: служебное значение фильтра, параметра нет
+    или он хранит не строку (например, ElementId).
+    """
+    if section is None or section in (ALL_VALUE, EMPTY_VALUE) or not section.strip():
+        return None
+    sample = sheet_collector(DB, doc).FirstElement()
+    param = sample.LookupParameter(param_name) if sample is not None else None
+    current().count('LookupParameter')
+    if param is None or param.StorageType != DB.StorageType.String:
+        return None
+    try:
+        rule = DB.ParameterFilterRuleFactory.CreateEqualsRule(param.Id, section)
+    except TypeError:
+        # До Revit 2023 правило принимает признак учета регистра
+        rule = DB.ParameterFilterRuleFactory.CreateEqualsRule(param.Id, section, True)
+    return DB.ElementParameterFilter(rule)
+
+
+def iter_sheets(DB, doc, section=None, param_name=SECTION_PARAMETER, placeholders=None):
+    """
+    Перебирает активные листы документа (без заглушек), не строя список
+    всех элементов. Если задан раздел, листы по возможности отбираются
+    фильтром Revit; точное совпадение проверяет filter_records.
+    placeholders - словарь, в который в том же проходе записываются
+    номера заглушек (element_id -> номер).
+    """
+    collector = sheet_collector(DB, doc)
+    parameter_filter = section_filter(DB, doc, section, param_name)
+    if parameter_filter is not None:
+        collector = collector.WherePasses(parameter_filter)
+    instrumentation = current()
+    if not instrumentation.enabled:
+        for sheet in collector:
+            # Признак заглушки не доступен фильтрам по параметрам - проверяем при переборе
+            if sheet is None:
+                continue
+            if not sheet.IsPlaceholder:
+                yield sheet
+            elif placeholders is not None:
+                placeholders[element_id_value(sheet.Id)] = sheet.SheetNumber
+        return
+    # С замерами: время перебора коллектора учитывается отдельно от чтения параметров
+    perf_counter = time.perf_counter
+    iterator = iter(collector)
+    started = perf_counter()
+    seconds = 0.0
+    elements = 0
+    try:
+        while True:
+            step_started = perf_counter()
+            sheet = next(iterator, _END)
+            seconds += perf_counter() - step_started
+            if sheet is _END:
+                break
+            elements += 1
+            if sheet is None:
+                continue
+            if not sheet.IsPlaceholder:
+                yield sheet
+            elif placeholders is not None:
+                placeholders[element_id_value(sheet.Id)] = sheet.SheetNumber
+    finally:
+        instrumentation.add('collection', seconds, started)
+        instrumentation.count('FilteredElementCollector.elements', elements)
+        instrumentation.count('IsPlaceholder', elements)
+
+
+_END = object()
+
+
+def collect_sheets(DB, doc, section=None, param_name=SECTION_PARAMETER):
+    """Возвращает все активные листы документа (без заглушек)"""
+    return list(iter_sheets(DB, doc, section, param_name))
+
+
+def read_sheet_records(DB, doc, sheets, param_name=SECTION_PARAMETER, sort_key=compact_sort_key,
+                       facet_params=()):
+    """
+    Читает номер, имя и значение параметра раздела для каждого листа.
+    Возвращает список SheetRecord, отсортированный как в Project Browser.
+    sort_key - функция ключа сортировки номера (например, SortKeyCache).
+    facet_params - имена параметров дополнительных фильтров, их значения
+    читаются в том же проходе в SheetRecord.values.
+    Значения разделов и параметров повторяются у многих листов, поэтому
+    строки интернируются: одинаковые значения хранятся одним объектом.
+    """
+    instrumentation = current()
+    records = []
+    element_names = {}
+    # Коллектор перебирается лениво, поэтому время чтения включает и время сбора листов
+    with instrumentation.phase('extraction'):
+        for sheet in sheets:
+            if hasattr(sheet, 'InternalElement'):
+                sheet = sheet.InternalElement
+            param_value = get_sheet_parameter_value(DB, doc, sheet, param_name, element_names)
+            section = intern(str(param_value)) if param_value else ""
+            values = ()
+            if facet_params:
+                values = tuple(intern(str(value)) if value else "" for value in (
+                    get_sheet_parameter_value(DB, doc, sheet, name, element_names) for name in facet_params))
+            number = sheet.SheetNumber
+            records.append(SheetRecord(element_id_value(sheet.Id), number, sheet.Name, section, values,
+                                       sort_key(number)))
+    with instrumentation.phase('sorting'):
+        records.sort(key=_record_key)
+    if instrumentation.enabled:
+        # Счетчики добавляются после цикла: на каждый лист - по вызову на параметр
+        count = len(records)
+        instrumentation.count('LookupParameter', count * (1 + len(facet_params)))
+        instrumentation.count('SheetNumber.get', count)
+        instrumentation.count('Name.get', count)
+    return records
+
+
+def _record_key(record):
+    return record.key
+
+
+def section_values(records):
+    """Уникальные значения раздела для выпадающего списка фильтра"""
+    values = set()
+    has_empty_values = False
+    for record in records:
+        if record.section.strip():
+            values.add(record.section)
+        else:
+            has_empty_values = True
+    values_list = sorted(values)
+    if has_empty_values:
+        values_list.append(EMPTY_VALUE)
+    return values_list
+
+
+def filter_records(records, selected_value):
+    """Листы, соответствующие значению фильтра, в порядке исходного списка"""
+    if selected_value == ALL_VALUE:
+        return list(records)
+    if selected_value == EMPTY_VALUE:
+        return [r for r in records if not r.section.strip()]
+    return [r for r in records if r.section == selected_value]
+
+
+def parse_integer(text, default=1):
+    """Целое число из текстового поля (default при неверном вводе)"""
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return default
+
+
+def format_number(prefix, number):
+    """Формирует новый номер: префикс + номер"""
+    if prefix:
+        return prefix + str(number)
+    return str(number)
+
+
+def plan_renumbering(records, start_number=1, prefix=''):
+    """
+    Строит план нумерации: список пар (запись листа, новый номер)
+    в порядке выбранных листов.
+    """
+    plan = []
+    current_number = start_number
+    for record in records:
+        plan.append((record, format_number(prefix, current_number)))
+        current_number += 1
+    return plan
+
+
+def apply_plan(DB, doc, plan, snapshot=None):
+    """
+    Присваивает листам новые номера по плану через planner: номера,
+    занятые другими листами и заглушками, проверяются заранее, сдвиги
+    и циклы выполняются в нужном порядке.
+    Должна вызываться внутри открытой транзакции.
+    Если передан снимок, номера в нем обновляются с сохранением сортировки.
+    Возвращает (список строк "Лист X -> Y", список ошибок).
+    """
+    # planner импортирует engine - импорт здесь, чтобы не было цикла
+    from sheet_numbering.planner import NumberIndex, apply_schedule, schedule
+    return apply_schedule(DB, doc, schedule(plan, NumberIndex.from_document(DB, doc)), snapshot)
+
+
+def format_result(renumbered_sheets, errors, start_number, prefix='', limit=50, renumbered_count=None):
+    """
+    Формирует текстовый отчет для выхода OUT.
+    renumbered_count - число перенумерованных листов, если в renumbered_sheets
+    передана только часть строк.
+    """
+    if renumbered_count is None:
+        renumbered_count = len(renumbered_sheets)
+    result_parts = ["Нумерация завершена!"]
+    if prefix:
+        result_parts.append("Префикс: {0}".format(prefix))
+    if start_number is not None:
+        result_parts.append("Начальный номер: {0}".format(start_number))
+    result_parts.append("Обработано листов: {0}".format(renumbered_count))
+
+    if len(renumbered_sheets) > 0:
+        result_parts.append("")
+        shown = renumbered_sheets[:limit]
+        for result in shown:
+            result_parts.append(result)
+        if renumbered_count > len(shown):
+            result_parts.append("... и еще {0} листов".format(renumbered_count - len(shown)))
+
+    if len(errors) > 0:
+        result_parts.append("")
+        result_parts.append("Ошибки:")
+        for error in errors:
+            result_parts.append(error)
+
+    return "\r\n".join(result_parts)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Индексы для фильтров списка листов.
+FacetIndex - обратный индекс параметра: значение -> множество element_id.
+SearchIndex - индекс слов номера и имени листа для поиска по мере ввода:
+слово запроса ищется как начало слова листа через bisect по отсортированному
+списку слов. Номер и имя разбиваются на слова из букв и из цифр,
+поэтому "АР-12.3" находится по запросам "ар", "12", "ар 3".
+
+Сочетание фильтров - пересечение готовых множеств element_id, начиная
+с наименьшего; листы снимка при этом заново не перебираются.
+"""
+
+import re
+from bisect import bisect_left, insort
+
+from sheet_numbering.engine import EMPTY_VALUE
+
+_WORD = re.compile(r'\d+|[^\W\d_]+')
+_NO_IDS = frozenset()
+
+
+def search_words(text):
+    """Слова текста для поиска (в нижнем регистре)"""
+    return _WORD.findall(text.lower())
+
+
+def record_words(record):
+    """Слова номера и имени листа без повторов"""
+    return set(search_words(record.number or '') + search_words(record.name or ''))
+
+
+class FacetIndex(object):
+    """Значение параметра -> element_id листов с этим значением"""
+
+    def __init__(self, name):
+        self.name = name
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def key(value):
+        """Ключ значения (пустые значения - "(Без значения)")"""
+        return value if value and value.strip() else EMPTY_VALUE
+
+    def add(self, element_id, value):
+        self.values.setdefault(self.key(value), set()).add(element_id)
+
+    def remove(self, element_id, value):
+        key = self.key(value)
+        ids = self.values.get(key)
+        if ids is not None:
+            ids.discard(element_id)
+            if not ids:
+                del self.values[key]
+
+    def ids(self, value):
+        """element_id листов со значением фильтра (множество нельзя изменять)"""
+        return self.values.get(value, _NO_IDS)
+
+    def value_list(self):
+        """Значения для выпадающего списка ("(Без значения)" в конце)"""
+        values = sorted(key for key in self.values if key != EMPTY_VALUE)
+        if EMPTY_VALUE in self.values:
+            values.append(EMPTY_VALUE)
+        return values
+
+    def has_values(self):
+        """Есть ли непустые значения - иначе фильтр не показывается"""
+        return any(key != EMPTY_VALUE for key in self.values)
+
+
+class SearchIndex(object):
+    """Слово -> element_id листов, в номере или имени которых оно встречается"""
+
+    def __init__(self, records=()):
+        self.words = {}
+        self.sorted_words = []
+        self._record_words = {}  # element_id -> слова, по которым лист проиндексирован
+        for record in records:
+            self._add_words(record)
+        self.sorted_words = sorted(self.words)
+
+    def __len__(self):
+        return len(self._record_words)
+
+    def _add_words(self, record):
+        words = record_words(record)
+        self._record_words[record.element_id] = words
+        index = self.words
+        new_words = []
+        for word in words:
+            ids = index.get(word)
+            if ids is None:
+                index[word] = {record.element_id}
+                new_words.append(word)
+            else:
+                ids.add(record.element_id)
+        return new_words
+
+    def add(self, record):
+        for word in self._add_words(record):
+            insort(self.sorted_words, word)
+
+    def remove(self, record):
+        words = self._record_words.pop(record.element_id, ())
+        for word in words:
+            ids = self.words[word]
+            ids.discard(record.element_id)
+            if not ids:
+                del self.words[word]
+                del self.sorted_words[bisect_left(self.sorted_words, word)]
+
+    def prefix_ids(self, prefix):
+        """element_id листов, у которых есть слово, начинающееся с prefix"""
+        words = self.sorted_words
+        start = bisect_left(words, prefix)
+        end = bisect_left(words, prefix + '\uffff', start)
+        if end - start == 1:
+            return self.words[words[start]]
+        index = self.words
+        return set().union(*[index[word] for word in words[start:end]])
+
+    def search(self, text):
+        """
+        element_id листов, подходящих под все слова запроса, или None,
+        если в запросе нет слов (фильтр не задан).
+        """
+        words = search_words(text)
+        if not words:
+            return None
+        # Длинные слова обычно отбирают меньше листов - начинаем с них
+        words.sort(key=len, reverse=True)
+        result = None
+        for word in words:
+            ids = self.prefix_ids(word)
+            result = ids if result is None else result & ids
+            if not result:
+                return _NO_IDS
+        return result
+
+
+def intersect(id_sets):
+    """Пересечение множеств element_id, начиная с наименьшего"""
+    id_sets = sorted(id_sets, key=len)
+    result = id_sets[0]
+    for ids in id_sets[1:]:
+        if not result:
+            break
+        result = result & ids
+    return result
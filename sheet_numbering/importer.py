@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Импорт новых номеров листов из таблицы соответствия (CSV, JSON, JSON Lines).
+Строка файла указывает лист по element_id, текущему номеру или имени
+и его новый номер. Файл читается потоково, строка за строкой; в памяти
+остается только словарь element_id -> новый номер. Листы находятся
+по хеш-индексам снимка, ошибки разбора и сопоставления собираются
+по строкам, а результат передается в тот же планировщик нумерации,
+что и шаблон номера.
+
+Заголовки колонок CSV (регистр и "_" не важны):
+    element_id / id, number / old_number / номер, name / имя, new_number / new / новый номер
+Файл без заголовка из двух колонок читается как "текущий номер; новый номер".
+JSON - массив объектов или JSON Lines с теми же ключами.
+"""
+
+import codecs
+import csv
+import io
+import json
+import os
+
+# Поля строки и допустимые заголовки колонок
+COLUMN_ALIASES = {
+    'element_id': ('element id', 'elementid', 'id'),
+    'number': ('number', 'old number', 'old', 'sheet number', 'номер', 'старый номер', 'номер листа'),
+    'name': ('name', 'sheet name', 'имя', 'имя листа', 'наименование'),
+    'new_number': ('new number', 'new', 'новый номер'),
+}
+JSON_EXTENSIONS = ('.json', '.jsonl', '.ndjson')
+# Размер блока при чтении файла
+CHUNK_SIZE = 1 << 16
+
+_AMBIGUOUS = object()
+
+
+def _normalize_header(text):
+    return " ".join(str(text).replace('_', ' ').lower().split())
+
+
+_HEADER_FIELDS = dict((_normalize_header(alias), field)
+                      for field, aliases in COLUMN_ALIASES.items() for alias in aliases)
+
+
+def detect_encoding(path):
+    """UTF-8 (с BOM или без) или cp1251 - кодировка CSV из Excel"""
+    with open(path, 'rb') as f:
+        sample = f.read(CHUNK_SIZE)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1251'
+
+
+def _iter_csv(stream):
+    """(номер строки, поля, ошибка) для строк CSV"""
+    first_line = stream.readline()
+    delimiter = max(';,\t', key=first_line.count)
+    reader = csv.reader(io.StringIO(first_line), delimiter=delimiter)
+    header = next(reader, [])
+    columns = [_HEADER_FIELDS.get(_normalize_header(cell)) for cell in header]
+    reader = csv.reader(stream, delimiter=delimiter)
+    rows = reader
+    if not any(columns):
+        # Без заголовка: "текущий номер; новый номер"
+        columns = ['number', 'new_number']
+        rows = _chain_first(header, reader)
+    if 'new_number' not in columns:
+        yield 1, None, "нет колонки с новым номером"
+        return
+    for row in rows:
+        # Первая строка файла прочитана отдельно, до reader
+        line = reader.line_num + 1 if reader.line_num else 1
+        if not any(cell.strip() for cell in row):
+            continue
+        # Пустые ячейки в конце строки (";;" после экспорта из Excel) не считаются лишними
+        if any(cell.strip() for cell in row[len(columns):]):
+            yield line, None, "лишние значения в строке"
+            continue
+        yield line, dict((field, value) for field, value in zip(columns, row) if field), None
+
+
+def _chain_first(first, rows):
+    if first:
+        yield first
+    for row in rows:
+        yield row
+
+
+def _fields_from_object(value):
+    if not isinstance(value, dict):
+        return None
+    fields = {}
+    for key, item in value.items():
+        field = _HEADER_FIELDS.get(_normalize_header(key))
+        if field and item is not None:
+            fields[field] = item if isinstance(item, str) else str(item)
+    return fields
+
+
+def _iter_json_lines(stream):
+    """(номер строки, поля, ошибка) для JSON Lines"""
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            fields = _fields_from_object(json.loads(text))
+        except ValueError as e:
+            yield line, None, "неверный JSON: {0}".format(e)
+            continue
+        if fields is None:
+            yield line, None, "ожидается объект"
+        else:
+            yield line, fields, None
+
+
+def _iter_json_array(stream):
+    """
+    (номер элемента, поля, ошибка) для элементов JSON-массива.
+    Файл читается блоками, в буфере хранится только неразобранный остаток.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    item = 0
+    expected = '['
+    while True:
+        # Пропускаем пробелы, дочитывая файл при необходимости
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer) and not eof:
+            chunk = stream.read(CHUNK_SIZE)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        char = buffer[position] if position < len(buffer) else ''
+        if expected == '[':
+            if char != '[':
+                yield 1, None, "ожидается массив объектов"
+                return
+            position += 1
+            expected = 'value'
+            continue
+        if char == ']':
+            return
+        if expected == ',':
+            if char != ',':
+                yield item + 1, None, "ожидается ',' между элементами"
+                return
+            position += 1
+            expected = 'value'
+            continue
+        if not char:
+            yield item + 1, None, "массив не закрыт"
+            return
+        # Элемент массива: если он обрывается на конце буфера, дочитываем блок
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except ValueError as e:
+            if eof:
+                yield item + 1, None, "неверный JSON: {0}".format(e)
+                return
+            end = len(buffer)
+        if end == len(buffer) and not eof:
+            chunk = stream.read(CHUNK_SIZE)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        item += 1
+        position = end
+        expected = ','
+        fields = _fields_from_object(value)
+        if fields is None:
+            yield item, None, "ожидается объект"
+        else:
+            yield item, fields, None
+
+
+def read_mapping(path, encoding=None):
+    """
+    Перебирает строки файла соответствия: (номер строки, поля, ошибка).
+    Поля - словарь с ключами из COLUMN_ALIASES, при ошибке разбора - None.
+    """
+    encoding = encoding or detect_encoding(path)
+    extension = os.path.splitext(path)[1].lower()
+    with io.open(path, encoding=encoding, newline='' if extension not in JSON_EXTENSIONS else None) as stream:
+        if extension not in JSON_EXTENSIONS:
+            rows = _iter_csv(stream)
+        elif extension == '.json' and _starts_with_array(stream):
+            rows = _iter_json_array(stream)
+        else:
+            rows = _iter_json_lines(stream)
+        for row in rows:
+            yield row
+
+
+def _starts_with_array(stream):
+    """Файл .json начинается с '[' (иначе читается как JSON Lines)"""
+    while True:
+        char = stream.read(1)
+        if not char or not char.isspace():
+            break
+    stream.seek(0)
+    return char == '['
+
+
+class MappingImport(object):
+    """
+    Новые номера из файла соответствия, сопоставленные с листами снимка.
+    Подставляется вместо NumberTemplate: format() и plan() возвращают
+    номера для переданных записей, листы без строки в файле сохраняют
+    текущий номер. errors - [(номер строки, сообщение)].
+    """
+
+    positional = False
+
+    def __init__(self, snapshot, path=None):
+        self.snapshot = snapshot
+        self.path = path
+        self.numbers = {}  # element_id -> новый номер
+        self.lines = {}  # element_id -> номер строки файла
+        self.errors = []
+        self.rows = 0
+        self._by_number = None
+        self._by_name = None
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __repr__(self):
+        return "MappingImport({0!r}, sheets={1}, errors={2})".format(self.path, len(self.numbers), len(self.errors))
+
+    def _index_by_number(self):
+        if self._by_number is None:
+            self._by_number = dict((record.number, record) for record in self.snapshot.records)
+        return self._by_number
+
+    def _index_by_name(self):
+        if self._by_name is None:
+            by_name = {}
+            for record in self.snapshot.records:
+                by_name[record.name] = _AMBIGUOUS if record.name in by_name else record
+            self._by_name = by_name
+        return self._by_name
+
+    def _find(self, fields):
+        """(запись листа, ошибка) по element_id, номеру или имени"""
+        element_id = fields.get('element_id', '').strip()
+        number = fields.get('number', '').strip()
+        name = fields.get('name', '').strip()
+        if element_id:
+            try:
+                record = self.snapshot.get(int(element_id))
+            except ValueError:
+                return None, "неверный element_id {0}".format(element_id)
+            if record is None:
+                return None, "лист с element_id {0} не найден".format(element_id)
+            if number and record.number != number:
+                return None, "лист {0} имеет номер {1}, а не {2}".format(element_id, record.number, number)
+            return record, None
+        if number:
+            record = self._index_by_number().get(number)
+            if record is None:
+                return None, "лист с номером {0} не найден".format(number)
+            return record, None
+        if name:
+            record = self._index_by_name().get(name)
+            if record is None:
+                return None, "лист с именем {0} не найден".format(name)
+            if record is _AMBIGUOUS:
+                return None, "несколько листов с именем {0}".format(name)
+            return record, None
+        return None, "не указан лист (element_id, номер или имя)"
+
+    def add(self, line, fields):
+        """Сопоставляет строку файла с листом, возвращает ошибку или None"""
+        self.rows += 1
+        new_number = fields.get('new_number', '').strip()
+        error = None
+        if not new_number:
+            error = "не указан новый номер"
+        else:
+            record, error = self._find(fields)
+            if record is not None:
+                first_line = self.lines.get(record.element_id)
+                if first_line is not None:
+                    error = "лист {0} уже указан в строке {1}".format(record.number, first_line)
+                else:
+                    self.numbers[record.element_id] = new_number
+                    self.lines[record.element_id] = line
+        if error is not None:
+            self.errors.append((line, error))
+        return error
+
+    def load(self, rows):
+        """Добавляет строки (номер строки, поля, ошибка) из read_mapping"""
+        for line, fields, error in rows:
+            if error is not None:
+                self.rows += 1
+                self.errors.append((line, error))
+            else:
+                self.add(line, fields)
+        return self
+
+    def records(self):
+        """Записи листов из файла в порядке снимка"""
+        numbers = self.numbers
+        return [record for record in self.snapshot.records if record.element_id in numbers]
+
+    def format(self, records):
+        numbers = self.numbers
+        return [numbers.get(record.element_id, record.number) for record in records]
+
+    def plan(self, records):
+        """План [(запись, новый номер), ...] как у NumberTemplate.plan"""
+        records = list(records)
+        return list(zip(records, self.format(records)))
+
+    def error_messages(self):
+        return ["Строка {0}: {1}".format(line, error) for line, error in self.errors]
+
+
+def import_mapping(snapshot, path, encoding=None):
+    """Читает файл соответствия и сопоставляет его строки с листами снимка"""
+    return MappingImport(snapshot, path).load(read_mapping(path, encoding))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Замеры времени этапов и счетчики вызовов Revit API.
+Скрипт включает замеры через start(); функции пакета получают текущий
+объект через current(). Когда замеры выключены, phase() возвращает общий
+пустой контекст, а count() сразу возвращается, поэтому стоимость -
+один вызов на этап. Счетчики в циклах по листам добавляются одним
+вызовом после цикла, а не на каждый лист.
+
+Трассировку можно записать в файл формата Chrome Trace Event
+(открывается в chrome://tracing или https://ui.perfetto.dev).
+"""
+
+import io
+import json
+import time
+
+# Сколько событий трассировки хранится (остальные только учитываются в счетчиках)
+TRACE_LIMIT = 100000
+
+
+class _NullPhase(object):
+    """Пустой контекст для выключенных замеров"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    """Замер одного выполнения этапа"""
+
+    __slots__ = ('owner', 'name', 'started')
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.owner.add(self.name, time.perf_counter() - self.started, self.started)
+        return False
+
+
+class Instrumentation(object):
+    """
+    Время этапов (число выполнений, сумма, максимум) и счетчики вызовов API.
+    trace=True - сохранять события для файла трассировки.
+    """
+
+    def __init__(self, enabled=True, trace=False, trace_limit=TRACE_LIMIT, origin=None):
+        self.enabled = enabled
+        self.trace = trace and enabled
+        self.trace_limit = trace_limit
+        self.phases = {}  # Этап -> [число, сумма, максимум]
+        self.calls = {}  # Вызов API -> число
+        self.events = []  # (этап, начало, длительность) для трассировки
+        self.dropped = 0
+        self._origin = time.perf_counter() if origin is None else origin  # Начало отсчета трассировки
+
+    def phase(self, name):
+        """Контекст замера этапа: with instrumentation.phase("filter"): ..."""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add(self, name, seconds, started=None):
+        """Добавляет выполнение этапа длительностью seconds"""
+        if not self.enabled:
+            return
+        stats = self.phases.get(name)
+        if stats is None:
+            self.phases[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+        if self.trace:
+            if len(self.events) < self.trace_limit:
+                if started is None:
+                    started = time.perf_counter() - seconds
+                self.events.append((name, started - self._origin, seconds))
+            else:
+                self.dropped += 1
+
+    def count(self, name, number=1):
+        """Учитывает number вызовов API name"""
+        if self.enabled and number:
+            self.calls[name] = self.calls.get(name, 0) + number
+
+    def output(self, trace_path=None):
+        """Структурированный раздел для выхода OUT"""
+        return {
+            'enabled': self.enabled,
+            'phases': dict((name, {'count': count, 'seconds': round(total, 6), 'max_seconds': round(longest, 6)})
+                           for name, (count, total, longest) in self.phases.items()),
+            'api_calls': dict(self.calls),
+            'trace': trace_path,
+        }
+
+    def write_trace(self, path):
+        """Записывает события в формате Chrome Trace Event"""
+        events = [{'name': name, 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': round(started * 1e6, 1), 'dur': round(seconds * 1e6, 1)}
+                  for name, started, seconds in self.events]
+        data = {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'api_calls': self.calls, 'dropped_events': self.dropped}}
+        with io.open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+
+# Выключенные замеры - значение по умолчанию
+DISABLED = Instrumentation(enabled=False)
+_current = DISABLED
+
+
+def current():
+    """Текущий объект замеров (DISABLED, если замеры не включены)"""
+    return _current
+
+
+def start(enabled=True, trace=False, origin=None):
+    """
+    Начинает замеры запуска скрипта; модуль живет весь сеанс, поэтому счетчики сбрасываются.
+    origin - время запуска скрипта (time.perf_counter()), если оно раньше вызова start.
+    """
+    global _current
+    _current = Instrumentation(enabled, trace, origin=origin) if enabled else DISABLED
+    return _current
+
+
+def stop():
+    global _current
+    _current = DISABLED
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Модель списка листов для диалога.
+Для каждого листа хранится одна легкая строка (SheetRow), которая
+создается при первом отображении. Состояние флажков хранится
+в SelectionModel, а не в элементах управления WPF.
+Список в окне только отображает видимые строки по element_id.
+
+Видимые строки задаются фильтрами по параметрам (раздел и параметры
+SheetSnapshot.facet_params) и строкой поиска. Фильтры сочетаются
+пересечением множеств element_id из индексов снимка.
+"""
+
+from sheet_numbering.engine import ALL_VALUE
+from sheet_numbering.facets import intersect
+from sheet_numbering.selection import SelectionModel
+
+
+class SheetRow(object):
+    """Строка списка: element_id и отображаемый текст"""
+
+    __slots__ = ('element_id', 'text')
+
+    def __init__(self, element_id, text):
+        self.element_id = element_id
+        self.text = text
+
+
+class SheetListModel(object):
+    """Строки листов, текущие фильтры и выбор"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.rows = {}  # element_id -> SheetRow, заполняется по мере отображения
+        self.selection = SelectionModel(snapshot.records)
+        self.filters = {}  # Имя параметра -> выбранное значение (кроме "Все")
+        self.search_text = ""
+        self._visible_ids = {}  # Кэш списков element_id по сочетанию фильтров (без поиска)
+
+    @property
+    def filter_value(self):
+        """Значение фильтра по разделу"""
+        return self.filters.get(self.snapshot.param_name, ALL_VALUE)
+
+    @property
+    def filter_key(self):
+        """Ключ сочетания фильтров для кэша или None, если задан поиск"""
+        if self.search_text.strip():
+            return None
+        return tuple(sorted(self.filters.items()))
+
+    def set_filter(self, value):
+        """Применяет фильтр по разделу, возвращает element_id видимых строк"""
+        return self.set_facet(self.snapshot.param_name, value)
+
+    def set_facet(self, name, value):
+        """Применяет фильтр по параметру name, возвращает element_id видимых строк"""
+        if value is None or value == ALL_VALUE:
+            self.filters.pop(name, None)
+        else:
+            self.filters[name] = value
+        return self._apply()
+
+    def set_search(self, text):
+        """Применяет строку поиска по номеру и имени, возвращает element_id видимых строк"""
+        self.search_text = text or ""
+        return self._apply()
+
+    def visible_records(self):
+        """Листы, проходящие все фильтры, в порядке снимка"""
+        snapshot = self.snapshot
+        id_sets = [snapshot.facets[name].ids(value) for name, value in self.filters.items()]
+        found = snapshot.search.search(self.search_text) if self.search_text.strip() else None
+        if found is not None:
+            id_sets.append(found)
+        if not id_sets:
+            return snapshot.records
+        if len(id_sets) == 1 and found is None:
+            # Один фильтр по разделу - готовый отсортированный список индекса
+            name, value = next(iter(self.filters.items()))
+            if name == snapshot.param_name:
+                return snapshot.filter(value)
+        ids = intersect(id_sets)
+        if not ids:
+            return []
+        return snapshot.select(ids)
+
+    def _apply(self):
+        self.selection.set_visible(self.visible_records())
+        return self.visible_ids()
+
+    def visible_ids(self):
+        """element_id видимых строк в порядке отображения"""
+        key = self.filter_key
+        ids = self._visible_ids.get(key) if key is not None else None
+        if ids is None:
+            ids = [record.element_id for record in self.selection.visible]
+            if key is not None:
+                self._visible_ids[key] = ids
+        return ids
+
+    def __len__(self):
+        return len(self.selection.visible)
+
+    def row(self, element_id):
+        """Строка листа (создается при первом обращении) или None"""
+        row = self.rows.get(element_id)
+        if row is None:
+            record = self.snapshot.get(element_id)
+            if record is None:
+                return None
+            row = SheetRow(element_id, "[{0}] {1}".format(record.number, record.name))
+            self.rows[element_id] = row
+        return row
+
+    def row_text(self, element_id):
+        row = self.row(element_id)
+        return row.text if row is not None else ""
+
+    def is_checked(self, element_id):
+        return self.selection.is_selected(element_id)
+
+    def click(self, element_id, shift=False):
+        """
+        Клик по флажку строки. С Shift выбирает диапазон от последнего
+        выбранного листа. Возвращает element_id строк, состояние которых изменилось.
+        """
+        if shift and self.selection.can_select_range():
+            return [record.element_id for record in self.selection.select_range(element_id)]
+        self.selection.click(element_id, not self.is_checked(element_id))
+        return [element_id]
+
+    def set_all_visible(self, state):
+        self.selection.set_all_visible(state)
+
+    def select_only(self, element_ids):
+        self.selection.select_only(element_ids)
+
+    def selected_records(self):
+        return self.selection.selected_records()
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Порядок записи новых номеров без конфликтов.
+Номер листа в Revit уникален, поэтому присвоить листу номер, который
+еще занят другим листом, нельзя. Планировщик строит индекс всех номеров
+документа (включая листы-заглушки), находит цепочки и циклы среди
+назначений и выдает последовательность шагов, в которой каждый номер
+свободен в момент записи. Временный номер используется только
+для разрыва цикла - по одному на цикл.
+"""
+
+import time
+
+from sheet_numbering.audit import (
+    STATUS_RENUMBERED, STATUS_UNCHANGED, STATUS_CONFLICT, STATUS_ERROR,
+    RenumberEntry, RenumberLog,
+)
+from sheet_numbering.engine import element_id_value, get_sheet_element, sheet_collector
+from sheet_numbering.instrument import current
+
+# Шаблон временного номера для разрыва циклов
+# (только буквы и цифры: Revit не допускает в номере листа \ : { } [ ] | ; < > ? ` ~)
+TEMPORARY_NUMBER = "TMP{0}"
+
+
+class NumberIndex(object):
+    """Номер листа -> element_id для всех листов документа"""
+
+    def __init__(self, numbers=None):
+        self.holders = dict(numbers) if numbers else {}
+
+    @classmethod
+    def from_document(cls, DB, doc):
+        """Индекс номеров всех листов документа, включая заглушки"""
+        instrumentation = current()
+        holders = {}
+        with instrumentation.phase('number_index'):
+            for sheet in sheet_collector(DB, doc):
+                if sheet is not None:
+                    holders[sheet.SheetNumber] = element_id_value(sheet.Id)
+        instrumentation.count('SheetNumber.get', len(holders))
+        index = cls()
+        index.holders = holders
+        return index
+
+    @classmethod
+    def from_records(cls, records, placeholders=None):
+        """
+        Индекс по записям снимка и номерам заглушек (element_id -> номер,
+        SnapshotCache.placeholders) без обращения к документу
+        """
+        with current().phase('number_index'):
+            holders = dict((record.number, record.element_id) for record in records)
+            if placeholders:
+                for element_id, number in placeholders.items():
+                    holders[number] = element_id
+        index = cls()
+        index.holders = holders
+        return index
+
+    def holder(self, number):
+        """element_id листа с этим номером или None"""
+        return self.holders.get(number)
+
+    def __contains__(self, number):
+        return number in self.holders
+
+    def move(self, element_id, old_number, new_number):
+        if self.holders.get(old_number) == element_id:
+            del self.holders[old_number]
+        self.holders[new_number] = element_id
+
+
+class RenumberStep(object):
+    """Шаг записи: листу record присваивается номер number"""
+
+    __slots__ = ('record', 'number', 'temporary')
+
+    def __init__(self, record, number, temporary=False):
+        self.record = record
+        self.number = number
+        self.temporary = temporary
+
+
+class RenumberSchedule(object):
+    """
+    Результат планирования: шаги в порядке выполнения и назначения,
+    которые выполнить нельзя (номер занят листом вне плана или
+    один номер назначен нескольким листам).
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.conflicts = []  # (record, new_number, причина)
+        self.unchanged = []  # Листы, у которых номер не меняется
+        self.cycles = 0
+
+    def __len__(self):
+        return len(self.steps)
+
+
+def _temporary_number(element_id, numbers, targets):
+    number = TEMPORARY_NUMBER.format(element_id)
+    while number in numbers or number in targets:
+        number = "X" + number
+    return number
+
+
+def schedule(plan, numbers):
+    """
+    Строит порядок записи для плана [(record, new_number), ...].
+    numbers - NumberIndex всех номеров документа до нумерации.
+    """
+    with current().phase('schedule'):
+        return _schedule(plan, numbers)
+
+
+def _schedule(plan, numbers):
+    result = RenumberSchedule()
+    moving = {}  # element_id -> (record, new_number)
+    targets = {}  # new_number -> element_id
+    for record, new_number in plan:
+        if new_number in targets:
+            result.conflicts.append((record, new_number, "номер {0} назначен нескольким листам".format(new_number)))
+        elif new_number == record.number:
+            targets[new_number] = record.element_id
+            result.unchanged.append(record)
+        else:
+            targets[new_number] = record.element_id
+            moving[record.element_id] = (record, new_number)
+
+    # Назначение ждет, пока лист, занимающий целевой номер, получит свой новый номер
+    ready = []
+    waiting_for = {}  # element_id листа-владельца -> element_id ждущего листа
+    for element_id, (record, new_number) in moving.items():
+        holder = numbers.holder(new_number)
+        if holder is None or holder == element_id:
+            ready.append(element_id)
+        elif holder in moving:
+            waiting_for[holder] = element_id
+        else:
+            result.conflicts.append((record, new_number, "номер {0} занят другим листом".format(new_number)))
+
+    # Цепочки: выполняем от свободного конца, освобождая номер для следующего
+    done = set()
+
+    def run_chain(element_id):
+        while element_id is not None:
+            record, new_number = moving[element_id]
+            result.steps.append(RenumberStep(record, new_number))
+            done.add(element_id)
+            element_id = waiting_for.pop(element_id, None)
+
+    for element_id in ready:
+        run_chain(element_id)
+
+    # Оставшиеся назначения образуют циклы или ждут конфликтного листа
+    checked = set()
+    for element_id in moving:
+        if element_id in done or element_id in checked:
+            continue
+        # Идем по цепочке ожидания: цикл замыкается на исходном листе
+        current = element_id
+        path = set()
+        while current in waiting_for and current not in path:
+            path.add(current)
+            current = waiting_for[current]
+        checked.update(path)
+        if not path or current != element_id:
+            continue
+        # Цикл: первый лист уходит на временный номер, освобождая свой номер,
+        # остальные идут по цепочке, последним первый лист получает свой номер
+        record, new_number = moving[element_id]
+        temporary = _temporary_number(element_id, numbers, targets)
+        result.steps.append(RenumberStep(record, temporary, temporary=True))
+        result.cycles += 1
+        run_chain(waiting_for.pop(element_id))
+
+    # Назначения, ждущие конфликтного листа, выполнить нельзя
+    conflicting = set(record.element_id for record, _, _ in result.conflicts)
+    for element_id, (record, new_number) in moving.items():
+        if element_id not in done and element_id not in conflicting:
+            result.conflicts.append((record, new_number, "номер {0} не освобождается".format(new_number)))
+    return result
+
+
+def apply_schedule(DB, doc, schedule_result, snapshot=None, log=None):
+    """
+    Выполняет шаги плана. Должна вызываться внутри открытой транзакции.
+    Листы запрашиваются из документа по element_id записей.
+    Результат каждого листа передается в журнал log (audit.RenumberLog),
+    включая конфликты и листы с неизменным номером.
+    Возвращает (список строк "Лист X -> Y", список ошибок), как engine.apply_plan;
+    если журнал ограничен, в списках только сохраненные им записи.
+    """
+    if log is None:
+        log = RenumberLog(limit=None)
+    instrumentation = current()
+    with instrumentation.phase('apply'):
+        writes = write_steps(DB, doc, schedule_result.steps, snapshot, log)
+    instrumentation.count('GetElement', len(schedule_result.steps))
+    instrumentation.count('SheetNumber.set', writes)
+    log_skipped(schedule_result, log)
+    return log.renumbered_lines(), log.error_lines()
+
+
+def write_steps(DB, doc, steps, snapshot, log, original_numbers=None, written=None):
+    """
+    Записывает номера по шагам steps, возвращает число присваиваний SheetNumber.
+    original_numbers - исходные номера листов с временным номером; передается,
+    если шаги одного плана выполняются частями. В written добавляются
+    (запись, исходный номер, новый номер) перенумерованных листов.
+    """
+    perf_counter = time.perf_counter
+    if original_numbers is None:
+        original_numbers = {}  # element_id -> (исходный номер, время записи временного номера)
+    writes = 0
+    for step in steps:
+        record = step.record
+        sheet = get_sheet_element(DB, doc, record.element_id)
+        if sheet is None or not hasattr(sheet, 'SheetNumber'):
+            continue
+        started = perf_counter()
+        old_number, seconds = original_numbers.pop(record.element_id, (record.number, 0.0))
+        writes += 1
+        try:
+            sheet.SheetNumber = step.number
+            seconds += perf_counter() - started
+            if step.temporary:
+                original_numbers[record.element_id] = (old_number, seconds)
+                continue
+            if snapshot is not None:
+                snapshot.renumber(record, step.number)
+            else:
+                record.number = step.number
+                record.key = None
+            if written is not None:
+                written.append((record, old_number, step.number))
+            log.add(RenumberEntry(record.element_id, old_number, step.number, STATUS_RENUMBERED, None, seconds))
+        except Exception as e:
+            seconds += perf_counter() - started
+            log.add(RenumberEntry(record.element_id, old_number, step.number, STATUS_ERROR, str(e), seconds))
+    return writes
+
+
+def log_skipped(schedule_result, log):
+    """Записи журнала для листов с неизменным номером и конфликтов"""
+    for record in schedule_result.unchanged:
+        log.add(RenumberEntry(record.element_id, record.number, record.number, STATUS_UNCHANGED))
+    for record, new_number, reason in schedule_result.conflicts:
+        log.add(RenumberEntry(record.element_id, record.number, new_number, STATUS_CONFLICT, reason))
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+Предварительный просмотр нумерации (dry-run).
+Показывает полное соответствие старых и новых номеров выбранных листов
+и отмечает конфликты - новые номера, занятые листами вне выбора, номера,
+назначенные нескольким выбранным листам (как planner.schedule: конфликтом
+считается каждое повторение номера после первого), и номера выбранных листов,
+которые сами своего номера не получат ("не освобождается": конфликт
+переходит по цепочке ожидания, как в planner.schedule).
+
+Для позиционных шаблонов (префикс + номер, "АР-{n:03}") новый номер строки
+однозначно задается ее позицией, поэтому номера не хранятся, а вычисляются
+при отображении. Заранее находятся строки, номера которых уже заняты
+в документе; при изменении выбора конфликты перепроверяются только для
+таких строк, начиная с первой затронутой. Для шаблонов, зависящих от
+раздела или имени листа, и для шаблонов с нулевым шагом (единственный
+случай, когда позиционные номера совпадают) план пересчитывается целиком.
+"""
+
+from bisect import bisect_left
+
+from sheet_numbering.template import NumberTemplate
+
+
+class RenumberPreview(object):
+    """
+    План нумерации выбранных листов, обновляемый по изменениям.
+    Листы нумеруются в порядке снимка (как в диалоге), numbers -
+    NumberIndex всех номеров документа для поиска конфликтов,
+    template - NumberTemplate новых номеров.
+    """
+
+    def __init__(self, snapshot, numbers, template=None):
+        self.snapshot = snapshot
+        self.numbers = numbers
+        self.template = template if template is not None else NumberTemplate.from_prefix('')
+        self.positions = dict((record.element_id, index)
+                              for index, record in enumerate(snapshot.records))
+        self.selected = set()
+        self._order = []  # Позиции выбранных листов в снимке, по возрастанию
+        self._records = []  # Выбранные записи в порядке нумерации
+        self._numbers = []  # Новые номера для непозиционных шаблонов
+        self._reserved = {}  # Строка -> element_id листа, уже имеющего ее новый номер
+        self._reserved_rows = []  # Строки из _reserved по возрастанию
+        self._reserved_by_holder = {}  # element_id владельца номера -> строка
+        # Строка -> element_id листа вне выбора, занимающего номер, выбранного
+        # листа, которому тот же номер назначен в строке выше, или выбранного
+        # листа, который не освобождает номер
+        self.conflicts = {}
+        self._duplicates = set()  # Строки, номер которых назначен выше другому выбранному листу
+        self._blocked = set()  # Строки, ждущие выбранного листа, который не получит свой номер
+        self.changed_from = 0  # Первая строка, изменившаяся при последнем обновлении
+        self.version = 0
+        self._find_reserved()
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def positional(self):
+        """Номера строк вычисляются по позиции и не повторяются"""
+        return self.template.positional and self.template.step != 0
+
+    def new_number(self, index):
+        template = self.template
+        if self.positional:
+            return template.counter_text(template.counter_value(index))
+        return self._numbers[index]
+
+    def entry(self, index):
+        """Строка предпросмотра: (запись, новый номер, причина конфликта или None)"""
+        number = self.new_number(index)
+        conflict = None
+        holder = self.conflicts.get(index)
+        if index in self._duplicates:
+            conflict = "номер {0} назначен нескольким листам".format(number)
+        elif index in self._blocked:
+            conflict = "номер {0} не освобождается".format(number)
+        elif holder is not None:
+            conflict = "номер {0} занят другим листом".format(number)
+        return self._records[index], number, conflict
+
+    def entries(self):
+        return [self.entry(index) for index in range(len(self._records))]
+
+    def plan(self):
+        """План [(запись, новый номер), ...] для планировщика"""
+        return [(record, self.new_number(index)) for index, record in enumerate(self._records)]
+
+    def set_template(self, template):
+        """Меняет шаблон номеров и пересчитывает план"""
+        self.template = template
+        self._find_reserved()
+
+    def _find_reserved(self):
+        """Находит строки, новые номера которых уже заняты в документе"""
+        reserved = {}
+        if self.positional:
+            index_of = self.template.index_of
+            for number, holder in self.numbers.holders.items():
+                index = index_of(number)
+                if index is not None:
+                    reserved[index] = holder
+        self._reserved = reserved
+        self._reserved_rows = sorted(reserved)
+        self._reserved_by_holder = dict((holder, index) for index, holder in reserved.items())
+        self.conflicts = {}
+        self._duplicates = set()
+        self._blocked = set()
+        self._check_rows_from(0)
+
+    def selection_changed(self, element_ids, state):
+        """Обновляет план после выбора (state=True) или снятия выбора с листов"""
+        if state:
+            changed = [i for i in element_ids if i not in self.selected and i in self.positions]
+        else:
+            changed = [i for i in element_ids if i in self.selected]
+        if not changed:
+            return
+        first = min(self.positions[i] for i in changed)
+        start = bisect_left(self._order, first)
+        if state:
+            self.selected.update(changed)
+        else:
+            self.selected.difference_update(changed)
+        if len(changed) == 1:
+            # Один лист: вставка или удаление через bisect
+            if state:
+                self._order.insert(start, first)
+                self._records.insert(start, self.snapshot.records[first])
+            else:
+                del self._order[start]
+                del self._records[start]
+        else:
+            # Несколько листов: пересобираем часть списка после первого изменения
+            positions = self.positions
+            tail = sorted(positions[i] for i in self.selected if positions[i] >= first)
+            records = self.snapshot.records
+            self._order[start:] = tail
+            self._records[start:] = [records[p] for p in tail]
+        # Лист, выбор которого изменился, мог занимать номер строки до start
+        rows = []
+        if self.positional:
+            for element_id in changed:
+                index = self._reserved_by_holder.get(element_id)
+                if index is not None and index < start:
+                    rows.append(index)
+        self._check_rows_from(start, rows)
+
+    def _check_rows_from(self, start, rows=()):
+        """
+        Перепроверяет конфликты занятых строк начиная со start и строк rows
+        выше start, затем цепочки ожидания (_check_chains)
+        """
+        if not self.positional:
+            self._recompute_all()
+            return
+        conflicts = self.conflicts
+        for index in [i for i in conflicts if i >= start]:
+            del conflicts[index]
+        self._blocked.difference_update([i for i in self._blocked if i >= start])
+        reserved_rows = self._reserved_rows
+        length = len(self._records)
+        for position in range(bisect_left(reserved_rows, start), len(reserved_rows)):
+            index = reserved_rows[position]
+            if index >= length:
+                break
+            self._check_row(index)
+        for index in rows:
+            self._check_row(index)
+        self.changed_from = self._check_chains(start, rows)
+        self.version += 1
+
+    def _check_chains(self, start, rows):
+        """
+        Отмечает строки, номер которых занят выбранным листом, который сам
+        своего номера не получит (как "не освобождается" в planner._schedule).
+        Строки от start проверяются подряд; выше start - только строки,
+        ждущие листов из строк от start и rows, и далее по цепочке, пока
+        конфликт строки меняется. Возвращает первую изменившуюся строку.
+        """
+        changed_from = min([start] + list(rows))
+        if not self._reserved:
+            return changed_from
+        memo = {}
+        link = self._positional_link
+        reserved_rows = self._reserved_rows
+        length = len(self._records)
+        for position in range(bisect_left(reserved_rows, start), len(reserved_rows)):
+            index = reserved_rows[position]
+            if index >= length:
+                break
+            if index not in self.conflicts and self._is_conflict(index, memo, link):
+                self._set_blocked(index, True)
+        by_holder = self._reserved_by_holder
+        pending = [(index, True) for index in rows]
+        if start < length:
+            # Строки выше start, номер которых занят листом из строк от start
+            first = self._order[start]
+            reserved = self._reserved
+            selected = self.selected
+            positions = self.positions
+            for position in range(bisect_left(reserved_rows, start)):
+                index = reserved_rows[position]
+                holder = reserved[index]
+                if holder in selected and positions[holder] >= first:
+                    pending.append((index, False))
+        while pending:
+            index, forced = pending.pop()
+            changed = forced
+            if index in self._blocked or index not in self.conflicts:
+                changed = self._set_blocked(index, self._is_conflict(index, memo, link)) or changed
+            if changed:
+                changed_from = min(changed_from, index)
+                dependent = by_holder.get(self._records[index].element_id)
+                if dependent is not None and dependent < start:
+                    pending.append((dependent, False))
+        return changed_from
+
+    def _positional_link(self, index):
+        """Строка листа, занимающего новый номер строки index, если лист выбран и должен его освободить"""
+        holder = self._reserved.get(index)
+        if holder is None or holder not in self.selected or holder == self._records[index].element_id:
+            return None
+        return bisect_left(self._order, self.positions[holder])
+
+    def _is_conflict(self, index, memo, link):
+        """
+        Строка не получит номер: конфликт самой строки или строки, которая
+        должна освободить ее номер. link(строка) - строка владельца номера
+        или None. Цикл ожидания конфликтом не считается: planner разрывает
+        его временным номером
+        """
+        path = []
+        result = False
+        while True:
+            known = memo.get(index)
+            if known is not None:
+                result = known
+                break
+            if index in self.conflicts and index not in self._blocked:
+                result = True
+                break
+            holder_row = link(index)
+            if holder_row is None:
+                break
+            # Пока цепочка не пройдена, строки пути считаются свободными: возврат к ним - цикл
+            memo[index] = False
+            path.append(index)
+            index = holder_row
+        for row in path:
+            memo[row] = result
+        return result
+
+    def _set_blocked(self, index, blocked):
+        """Отмечает или снимает ожидание конфликтной строки; True, если отметка изменилась"""
+        if blocked == (index in self._blocked):
+            return False
+        if blocked:
+            self._blocked.add(index)
+            self.conflicts[index] = self._reserved[index]
+        else:
+            self._blocked.discard(index)
+            del self.conflicts[index]
+        return True
+
+    def _recompute_all(self):
+        """Полный пересчет номеров и конфликтов для непозиционных шаблонов"""
+        self._numbers = self.template.format(self._records)
+        holder_of = self.numbers.holder
+        selected = self.selected
+        records = self._records
+        conflicts = {}
+        duplicates = set()
+        first_rows = {}  # Номер -> первая строка, которой он назначен
+        for index, number in enumerate(self._numbers):
+            first = first_rows.setdefault(number, index)
+            if first != index:
+                conflicts[index] = records[first].element_id
+                duplicates.add(index)
+        # Выбранный лист с повторным номером не переносится и не освобождает свой номер
+        staying = set(records[index].element_id for index in duplicates)
+        holders = {}  # Строка -> выбранный лист, который должен освободить ее номер
+        for number, index in first_rows.items():
+            holder = holder_of(number)
+            if holder is None or holder == records[index].element_id:
+                continue
+            if holder not in selected or holder in staying:
+                conflicts[index] = holder
+            else:
+                holders[index] = holder
+        self.conflicts = conflicts
+        self._duplicates = duplicates
+        self._blocked = set()
+        if holders:
+            rows = dict((record.element_id, index) for index, record in enumerate(records))
+            links = dict((index, rows[holder]) for index, holder in holders.items())
+            memo = {}
+            for index, holder in holders.items():
+                if self._is_conflict(index, memo, links.get):
+                    conflicts[index] = holder
+                    self._blocked.add(index)
+        self.changed_from = 0
+        self.version += 1
+
+    def _check_row(self, index):
+        self._blocked.discard(index)
+        holder = self._reserved.get(index)
+        if (holder is not None and index < len(self._records) and holder not in self.selected
+                and holder != self._records[index].element_id):
+            self.conflicts[index] = holder
+        else:
+            self.conflicts.pop(index, None)
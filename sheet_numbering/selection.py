@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Модель выбора листов в диалоге.
+Выбор хранится как множество element_id, видимые листы - как список
+с индексом позиций, поэтому поиск листа по клику выполняется за O(1),
+а выбор диапазона с Shift затрагивает только сам диапазон.
+"""
+
+
+class SelectionModel(object):
+    """Состояние выбора листов и порядок видимых листов"""
+
+    def __init__(self, records):
+        self.records = records
+        self.selected = set()
+        self.visible = []
+        self._positions = None
+        self.anchor = -1  # Позиция последнего выбранного листа для Shift-выбора
+        # Подписчики на изменение выбора: вызываются как listener(element_ids, state)
+        self.listeners = []
+        self.set_visible(records)
+
+    def set_visible(self, records):
+        """Задает видимые листы (после смены фильтра) и сбрасывает опорный лист"""
+        self.visible = records
+        self._positions = None
+        self.anchor = -1
+
+    @property
+    def positions(self):
+        """element_id -> позиция среди видимых (строится при первом клике после смены фильтра)"""
+        if self._positions is None:
+            self._positions = dict((record.element_id, index)
+                                   for index, record in enumerate(self.visible))
+        return self._positions
+
+    def index_of(self, element_id):
+        """Позиция листа среди видимых или -1"""
+        return self.positions.get(element_id, -1)
+
+    def is_selected(self, element_id):
+        return element_id in self.selected
+
+    def set_selected(self, element_id, state):
+        if (element_id in self.selected) == bool(state):
+            return
+        if state:
+            self.selected.add(element_id)
+        else:
+            self.selected.discard(element_id)
+        self._notify([element_id], state)
+
+    def _notify(self, element_ids, state):
+        if element_ids:
+            for listener in self.listeners:
+                listener(element_ids, state)
+
+    def click(self, element_id, state):
+        """Обычный клик: меняет состояние листа и запоминает его как опорный"""
+        self.set_selected(element_id, state)
+        self.anchor = self.index_of(element_id)
+
+    def can_select_range(self):
+        return 0 <= self.anchor < len(self.visible)
+
+    def select_range(self, element_id):
+        """
+        Клик с Shift: все листы от опорного до текущего получают
+        состояние опорного листа. Возвращает список измененных записей.
+        """
+        current_index = self.index_of(element_id)
+        if current_index < 0 or not self.can_select_range():
+            return []
+        state = self.is_selected(self.visible[self.anchor].element_id)
+        start_idx = min(self.anchor, current_index)
+        end_idx = max(self.anchor, current_index)
+        selected = self.selected
+        if state:
+            changed = [r for r in self.visible[start_idx:end_idx + 1]
+                       if r.element_id not in selected]
+            selected.update(r.element_id for r in changed)
+        else:
+            changed = [r for r in self.visible[start_idx:end_idx + 1]
+                       if r.element_id in selected]
+            selected.difference_update(r.element_id for r in changed)
+        self.anchor = current_index
+        self._notify([r.element_id for r in changed], state)
+        return changed
+
+    def set_all_visible(self, state):
+        """Выбирает или снимает выбор со всех видимых листов"""
+        selected = self.selected
+        if state:
+            ids = [r.element_id for r in self.visible if r.element_id not in selected]
+            selected.update(ids)
+        else:
+            ids = [r.element_id for r in self.visible if r.element_id in selected]
+            selected.difference_update(ids)
+        self._notify(ids, state)
+
+    def select_only(self, element_ids):
+        """Заменяет выбор указанными листами (например, листами из файла импорта)"""
+        element_ids = set(element_ids)
+        removed = [i for i in self.selected if i not in element_ids]
+        added = [i for i in element_ids if i not in self.selected]
+        self.selected.difference_update(removed)
+        self.selected.update(added)
+        self._notify(removed, False)
+        self._notify(added, True)
+
+    def selected_records(self):
+        """Выбранные листы (включая скрытые фильтром) в порядке полного списка"""
+        selected = self.selected
+        return [record for record in self.records if record.element_id in selected]
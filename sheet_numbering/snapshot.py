@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Снимок листов документа: данные листов читаются из Revit один раз,
+после чего фильтрация по разделу выполняется по готовому индексу
+без обращений к Revit API. Списки листов раздела берутся из
+отсортированного полного списка и повторно не сортируются.
+Для раздела и параметров дополнительных фильтров строятся обратные
+индексы (значение -> element_id), индекс поиска по номеру и имени
+строится при первом поиске.
+"""
+
+from sheet_numbering.engine import (
+    SECTION_PARAMETER, ALL_VALUE, EMPTY_VALUE,
+    filter_records, iter_sheets, read_sheet_records,
+)
+from sheet_numbering.facets import FacetIndex, SearchIndex
+from sheet_numbering.sorting import SortKeyCache, SortedSheetIndex
+
+
+class SheetSnapshot(object):
+    """
+    Отсортированный список записей листов и индексы по ним:
+    element_id -> запись и значение раздела -> записи раздела.
+    Списки в индексе раздела хранятся в том же порядке, что и records.
+    records должны быть уже отсортированы ключом sort_key.
+    facets - FacetIndex раздела (по param_name) и параметров facet_params,
+    значения которых записаны в SheetRecord.values.
+    search - построить индекс поиска сразу, вместе с индексами фильтров
+    (иначе он строится при первом поиске).
+    """
+
+    def __init__(self, records, param_name=SECTION_PARAMETER, sort_key=None, facet_params=(), search=False):
+        self.param_name = param_name
+        self.facet_params = tuple(facet_params)
+        self.sort_key = sort_key if sort_key is not None else SortKeyCache()
+        self.index = SortedSheetIndex(records, self.sort_key, presorted=True)
+        self.records = self.index.records
+        self.by_id = {}
+        section_records = {}
+        for record in self.records:
+            self.by_id[record.element_id] = record
+            section_records.setdefault(self.section_key(record), []).append(record)
+        self.sections = dict((key, SortedSheetIndex(value, self.sort_key, presorted=True))
+                             for key, value in section_records.items())
+        self.facets = {param_name: FacetIndex(param_name)}
+        self.facets[param_name].values = dict(
+            (key, set(record.element_id for record in value)) for key, value in section_records.items())
+        for position, name in enumerate(self.facet_params):
+            facet = self.facets[name] = FacetIndex(name)
+            for record in self.records:
+                facet.add(record.element_id, record.values[position])
+        self._search = SearchIndex(self.records) if search else None
+        self._positions = None  # element_id -> позиция записи в records
+
+    @staticmethod
+    def section_key(record):
+        """Ключ раздела записи в индексе (пустые значения - "(Без значения)")"""
+        return record.section if record.section.strip() else EMPTY_VALUE
+
+    def __len__(self):
+        return len(self.records)
+
+    def section_values(self):
+        """Значения для выпадающего списка фильтра ("(Без значения)" в конце)"""
+        values = sorted(key for key in self.sections if key != EMPTY_VALUE)
+        if EMPTY_VALUE in self.sections:
+            values.append(EMPTY_VALUE)
+        return values
+
+    def filter(self, selected_value):
+        """
+        Листы, соответствующие значению фильтра.
+        Возвращается список из индекса - его нельзя изменять.
+        """
+        if selected_value == ALL_VALUE:
+            return self.records
+        section = self.sections.get(selected_value)
+        return section.records if section is not None else []
+
+    def get(self, element_id):
+        """Запись листа по целому ElementId или None"""
+        return self.by_id.get(element_id)
+
+    def positions(self):
+        """element_id -> позиция записи в records"""
+        if self._positions is None:
+            self._positions = dict((record.element_id, position) for position, record in enumerate(self.records))
+        return self._positions
+
+    def select(self, ids):
+        """
+        Листы из множества element_id ids в порядке сортировки: сортируются
+        только позиции выбранных листов, а не перебирается весь список
+        """
+        records = self.records
+        positions = self.positions()
+        return [records[position] for position in sorted(positions[i] for i in ids)]
+
+    @property
+    def search(self):
+        """SearchIndex по номерам и именам (строится при первом обращении)"""
+        if self._search is None:
+            self._search = SearchIndex(self.records)
+        return self._search
+
+    def facet_values(self, record):
+        """(FacetIndex, значение записи) для всех фильтров"""
+        yield self.facets[self.param_name], record.section
+        for position, name in enumerate(self.facet_params):
+            yield self.facets[name], record.values[position]
+
+    def add(self, record):
+        """Добавляет запись листа в снимок и индексы"""
+        self._positions = None
+        self.index.add(record)
+        self.by_id[record.element_id] = record
+        key = self.section_key(record)
+        section = self.sections.get(key)
+        if section is None:
+            self.sections[key] = SortedSheetIndex([record], self.sort_key, presorted=True)
+        else:
+            section.add(record)
+        for facet, value in self.facet_values(record):
+            facet.add(record.element_id, value)
+        if self._search is not None:
+            self._search.add(record)
+
+    def remove(self, record):
+        """Удаляет запись листа из снимка и индексов"""
+        self._positions = None
+        self.index.remove(record)
+        del self.by_id[record.element_id]
+        key = self.section_key(record)
+        section = self.sections[key]
+        section.remove(record)
+        if not len(section):
+            del self.sections[key]
+        for facet, value in self.facet_values(record):
+            facet.remove(record.element_id, value)
+        if self._search is not None:
+            self._search.remove(record)
+
+    def renumber(self, record, new_number):
+        """Меняет номер листа в снимке, сохраняя порядок сортировки"""
+        self._positions = None
+        if self._search is not None:
+            self._search.remove(record)
+        section = self.sections[self.section_key(record)]
+        self.index.remove(record)
+        section.remove(record)
+        record.number = new_number
+        record.key = self.sort_key(new_number)
+        self.index.add(record)
+        section.add(record)
+        if self._search is not None:
+            self._search.add(record)
+
+
+def take_snapshot(DB, doc, param_name=SECTION_PARAMETER, section=None, facet_params=(), placeholders=None,
+                  search=False):
+    """
+    Собирает листы документа и строит снимок за один проход.
+    section - значение параметра раздела, если нужны только листы раздела.
+    facet_params - параметры дополнительных фильтров.
+    placeholders - словарь для номеров заглушек (см. iter_sheets).
+    search - построить индекс поиска по номеру и имени в том же проходе.
+    """
+    facet_params = tuple(name for name in facet_params if name != param_name)
+    sort_key = SortKeyCache()
+    records = read_sheet_records(DB, doc, iter_sheets(DB, doc, section, param_name, placeholders), param_name,
+                                 sort_key, facet_params)
+    if section is not None:
+        records = filter_records(records, section)
+    return SheetSnapshot(records, param_name, sort_key, facet_params, search)
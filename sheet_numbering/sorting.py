@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Естественная сортировка номеров листов (как в Project Browser Revit),
+кэш ключей сортировки и отсортированный индекс записей листов,
+который поддерживает вставку и удаление через bisect.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from sys import intern
+
+# Разбиение строки на числа и нечисловые части.
+# Из-за группы в шаблоне числа всегда оказываются на нечетных позициях
+_NUMBER_SPLIT = re.compile(r'(\d+)').split
+
+
+# Функция для естественной сортировки (natural sort) - как в Project Browser Revit
+# Преобразует строку в кортеж с типами для правильного сравнения смешанных типов
+def natural_sort_key(text):
+    """
+    Преобразует строку в ключ для естественной сортировки.
+    Возвращает кортеж кортежей: ((тип, значение), ...)
+    где тип: 0 для чисел, 1 для строк
+    Это позволяет корректно сравнивать смешанные значения.
+    Пример: '12' -> ((0, 12),), '2' -> ((0, 2),), 'A10' -> ((1, 'a'), (0, 10))
+    Сортирует так же, как Project Browser в Revit (1, 2, 3, ..., 9, 10, 11, ...)
+    """
+    if text is None:
+        return ((1, ''),)
+    text = str(text)
+    parts = []
+    is_number = False
+    for part in _NUMBER_SPLIT(text):
+        if part:
+            if is_number:
+                parts.append((0, int(part)))  # 0 - тип для чисел (сравниваются как числа)
+            else:
+                parts.append((1, part.lower()))  # 1 - тип для строк (сравниваются без учета регистра)
+        is_number = not is_number
+    return tuple(parts) if parts else ((1, text.lower()),)
+
+
+def compact_sort_key(text):
+    """
+    Ключ с тем же порядком, что у natural_sort_key, в виде плоского кортежа
+    (тип, значение, тип, значение, ...): пары фиксированной длины сравниваются
+    так же, как вложенные кортежи. Один кортеж вместо кортежа пар и
+    интернированные текстовые части занимают в несколько раз меньше памяти.
+    """
+    if text is None:
+        return (1, '')
+    text = str(text)
+    parts = []
+    is_number = False
+    for part in _NUMBER_SPLIT(text):
+        if part:
+            if is_number:
+                parts.append(0)
+                parts.append(int(part))
+            else:
+                parts.append(1)
+                parts.append(intern(part.lower()))
+        is_number = not is_number
+    return tuple(parts) if parts else (1, intern(text.lower()))
+
+
+class SortKeyCache(object):
+    """Кэш ключей сортировки по номеру листа (по умолчанию - compact_sort_key)"""
+
+    def __init__(self, key_function=compact_sort_key):
+        self.key_function = key_function
+        self._keys = {}
+
+    def __call__(self, number):
+        key = self._keys.get(number)
+        if key is None:
+            key = self.key_function(number)
+            self._keys[number] = key
+        return key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def clear(self):
+        self._keys.clear()
+
+
+class SortedSheetIndex(object):
+    """
+    Записи листов, упорядоченные по ключу естественной сортировки номера.
+    Ключ, по которому запись размещена, хранится в самой записи (SheetRecord.key),
+    поэтому после изменения номера запись можно переставить через reposition().
+    Запись, входящую в несколько индексов, переставляют через remove() и add()
+    в каждом индексе. При равных ключах сохраняется порядок добавления.
+    """
+
+    def __init__(self, records=(), sort_key=None, presorted=False):
+        self.sort_key = sort_key if sort_key is not None else SortKeyCache()
+        self.records = list(records)
+        for record in self.records:
+            if record.key is None:
+                record.key = self.sort_key(record.number)
+        if not presorted:
+            self.records.sort(key=_record_key)
+        self._keys = [record.key for record in self.records]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def __contains__(self, record):
+        try:
+            self.index(record)
+            return True
+        except ValueError:
+            return False
+
+    def index(self, record):
+        """Позиция записи в индексе, ValueError если записи нет"""
+        key = record.key
+        keys = self._keys
+        records = self.records
+        element_id = record.element_id
+        if key is not None:
+            position = bisect_left(keys, key)
+            while position < len(keys) and keys[position] == key:
+                if records[position].element_id == element_id:
+                    return position
+                position += 1
+        raise ValueError("Лист {0} отсутствует в индексе".format(record.element_id))
+
+    def add(self, record):
+        """Вставляет запись на место, соответствующее ее номеру"""
+        key = record.key
+        if key is None:
+            key = record.key = self.sort_key(record.number)
+        position = bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self.records.insert(position, record)
+        return position
+
+    def remove(self, record):
+        """Удаляет запись из индекса"""
+        position = self.index(record)
+        del self._keys[position]
+        del self.records[position]
+        return position
+
+    def reposition(self, record):
+        """Переставляет запись после изменения ее номера"""
+        key = self.sort_key(record.number)
+        if record.key == key:
+            return self.index(record)
+        self.remove(record)
+        record.key = key
+        return self.add(record)
+
+
+def _record_key(record):
+    return record.key
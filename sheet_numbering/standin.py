@@ -0,0 +1,662 @@
+# -*- coding: utf-8 -*-
+"""
+Упрощенная замена пространства имен Autodesk.Revit.DB для запуска без Revit.
+Повторяет только то, что использует скрипт нумерации: Document, ViewSheet,
+Parameter, ElementId, StorageType, FilteredElementCollector (с быстрыми
+фильтрами и фильтром по значению параметра), Transaction и TransactionGroup.
+После подтверждения транзакции и отката группы транзакций вызывается
+событие DocumentChanged со списками измененных, добавленных и удаленных элементов.
+"""
+
+import random
+import uuid
+
+
+class StorageType(object):
+    """Типы хранения значения параметра"""
+    None_ = 'None'
+    Integer = 'Integer'
+    Double = 'Double'
+    String = 'String'
+    ElementId = 'ElementId'
+
+
+class ElementId(object):
+    """Идентификатор элемента"""
+
+    InvalidElementId = None
+
+    def __init__(self, value):
+        self.Value = int(value)
+
+    @property
+    def IntegerValue(self):
+        return self.Value
+
+    def __eq__(self, other):
+        return isinstance(other, ElementId) and other.Value == self.Value
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.Value)
+
+    def __repr__(self):
+        return "ElementId({0})".format(self.Value)
+
+
+ElementId.InvalidElementId = ElementId(-1)
+
+# Имя параметра -> ElementId (как у общих параметров - один на проект)
+_PARAMETER_IDS = {}
+
+
+def parameter_id(name):
+    """ElementId параметра с указанным именем"""
+    element_id = _PARAMETER_IDS.get(name)
+    if element_id is None:
+        element_id = ElementId(900000 + len(_PARAMETER_IDS))
+        _PARAMETER_IDS[name] = element_id
+    return element_id
+
+
+class BuiltInCategory(object):
+    """Категории элементов"""
+    INVALID = 'INVALID'
+    OST_Sheets = 'OST_Sheets'
+
+
+class Parameter(object):
+    """Параметр элемента с фиксированным типом хранения"""
+
+    def __init__(self, name, storage_type, value, element=None):
+        self.Id = parameter_id(name)
+        self.Name = name
+        self.StorageType = storage_type
+        self._value = value
+        self._element = element
+
+    def AsString(self):
+        return self._value if self.StorageType == StorageType.String else None
+
+    def AsInteger(self):
+        return self._value if self.StorageType == StorageType.Integer else 0
+
+    def AsDouble(self):
+        return self._value if self.StorageType == StorageType.Double else 0.0
+
+    def AsElementId(self):
+        if self.StorageType == StorageType.ElementId:
+            return self._value
+        return ElementId.InvalidElementId
+
+    def AsValueString(self):
+        return None if self._value is None else str(self._value)
+
+    def Set(self, value):
+        element = self._element
+        if element is not None and element.Document is not None:
+            old_value = self._value
+            element.Document._modify(element, _restore_value, self, old_value)
+        self._value = value
+        return True
+
+
+def _restore_value(param, value):
+    param._value = value
+
+
+def _restore_name(element, value):
+    element._name = value
+
+
+class Element(object):
+    """Базовый элемент документа"""
+
+    category = BuiltInCategory.INVALID
+
+    def __init__(self, name=""):
+        self.Id = ElementId.InvalidElementId
+        self.Document = None
+        self._name = name
+        self._parameters = {}
+
+    @property
+    def Name(self):
+        return self._name
+
+    @Name.setter
+    def Name(self, value):
+        if self.Document is not None:
+            old_name = self._name
+            self.Document._modify(self, _restore_name, self, old_name)
+        self._name = value
+
+    def LookupParameter(self, name):
+        return self._parameters.get(name)
+
+    def add_parameter(self, name, storage_type, value):
+        """Добавляет параметр к элементу (только для заглушки)"""
+        param = Parameter(name, storage_type, value, self)
+        self._parameters[name] = param
+        return param
+
+
+class ViewSheet(Element):
+    """Лист. Номер листа уникален в пределах документа, как в Revit."""
+
+    category = BuiltInCategory.OST_Sheets
+
+    def __init__(self, number, name="", is_placeholder=False):
+        Element.__init__(self, name)
+        self._number = number
+        self.IsPlaceholder = is_placeholder
+
+    @property
+    def SheetNumber(self):
+        return self._number
+
+    @SheetNumber.setter
+    def SheetNumber(self, value):
+        doc = self.Document
+        if doc is not None:
+            doc._change_sheet_number(self, value)
+        else:
+            self._number = value
+
+
+class Transaction(object):
+    """Транзакция: изменения документа откатываются при RollBack"""
+
+    def __init__(self, doc, name=""):
+        self._doc = doc
+        self.Name = name
+        self._started = False
+
+    def Start(self):
+        if self._doc._transaction is not None:
+            raise InvalidOperationException("Транзакция уже открыта")
+        self._doc._transaction = self
+        self._doc._journal = []
+        self._doc._changes = ({}, {}, {})
+        self._started = True
+
+    def Commit(self):
+        doc = self._doc
+        modified, added, deleted = doc._changes
+        if doc._group is not None:
+            doc._group._merge(doc._journal, doc._changes)
+        self._finish()
+        if modified or added or deleted:
+            _raise_changed(doc, modified, added, deleted)
+
+    def RollBack(self):
+        for undo, target, value in reversed(self._doc._journal):
+            undo(target, value)
+        self._finish()
+
+    def HasStarted(self):
+        return self._started
+
+    def _finish(self):
+        self._doc._transaction = None
+        self._doc._journal = []
+        self._doc._changes = ({}, {}, {})
+        self._started = False
+
+
+def _raise_changed(doc, modified, added, deleted):
+    doc.Application.DocumentChanged.raise_event(doc.Application, DocumentChangedEventArgs(
+        doc, list(modified.values()), list(added.values()), [e.Id for e in deleted.values()]))
+
+
+class TransactionGroup(object):
+    """
+    Группа транзакций: подтвержденные внутри нее транзакции откатываются
+    вместе при RollBack. Assimilate и Commit завершают группу.
+    """
+
+    def __init__(self, doc, name=""):
+        self._doc = doc
+        self.Name = name
+        self._started = False
+        self._journal = []
+        self._changes = ({}, {}, {})
+
+    def Start(self):
+        doc = self._doc
+        if doc._transaction is not None or doc._group is not None:
+            raise InvalidOperationException("Транзакция или группа транзакций уже открыта")
+        doc._group = self
+        self._journal = []
+        self._changes = ({}, {}, {})
+        self._started = True
+
+    def _merge(self, journal, changes):
+        """Добавляет изменения подтвержденной транзакции"""
+        self._journal.extend(journal)
+        modified, added, deleted = self._changes
+        for element_id, element in changes[1].items():
+            added[element_id] = element
+        for element_id, element in changes[0].items():
+            if element_id not in added:
+                modified[element_id] = element
+        for element_id, element in changes[2].items():
+            modified.pop(element_id, None)
+            if added.pop(element_id, None) is None:
+                deleted[element_id] = element
+
+    def _check_open(self):
+        if self._doc._transaction is not None:
+            raise InvalidOperationException("Внутри группы открыта транзакция")
+
+    def Assimilate(self):
+        self._check_open()
+        self._finish()
+
+    def Commit(self):
+        self._check_open()
+        self._finish()
+
+    def RollBack(self):
+        self._check_open()
+        for undo, target, value in reversed(self._journal):
+            undo(target, value)
+        modified, added, deleted = self._changes
+        self._finish()
+        # Откат группы - тоже изменение документа: добавленные элементы удалены, удаленные возвращены
+        if modified or added or deleted:
+            _raise_changed(self._doc, modified, deleted, added)
+
+    def HasStarted(self):
+        return self._started
+
+    def _finish(self):
+        self._doc._group = None
+        self._journal = []
+        self._changes = ({}, {}, {})
+        self._started = False
+
+
+class Event(object):
+    """Событие .NET: обработчики подключаются через += и отключаются через -="""
+
+    def __init__(self):
+        self._handlers = []
+
+    def __iadd__(self, handler):
+        self._handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        if handler in self._handlers:
+            self._handlers.remove(handler)
+        return self
+
+    def raise_event(self, sender, args):
+        for handler in list(self._handlers):
+            handler(sender, args)
+
+
+class ElementCategoryFilter(object):
+    """Фильтр по категории элемента"""
+
+    def __init__(self, category):
+        self._category = category
+
+    def PassesFilter(self, element):
+        return element.category == self._category
+
+
+class DocumentChangedEventArgs(object):
+    """Аргументы события DocumentChanged"""
+
+    def __init__(self, doc, modified, added, deleted_ids):
+        self._doc = doc
+        self._modified = modified
+        self._added = added
+        self._deleted_ids = deleted_ids
+
+    def GetDocument(self):
+        return self._doc
+
+    def GetModifiedElementIds(self, element_filter=None):
+        return [e.Id for e in self._modified if element_filter is None or element_filter.PassesFilter(e)]
+
+    def GetAddedElementIds(self, element_filter=None):
+        return [e.Id for e in self._added if element_filter is None or element_filter.PassesFilter(e)]
+
+    def GetDeletedElementIds(self):
+        return list(self._deleted_ids)
+
+
+class DocumentClosingEventArgs(object):
+    """Аргументы события DocumentClosing"""
+
+    def __init__(self, doc):
+        self.Document = doc
+
+
+class Application(object):
+    """Приложение: события изменения и закрытия документов"""
+
+    def __init__(self):
+        self.DocumentChanged = Event()
+        self.DocumentClosing = Event()
+
+
+class DocumentVersion(object):
+    """Версия документа: меняется при каждом сохранении"""
+
+    def __init__(self, version_guid, number_of_saves):
+        self.VersionGUID = version_guid
+        self.NumberOfSaves = number_of_saves
+
+
+# Приложение, которому принадлежат все документы заглушки
+APPLICATION = Application()
+
+# Символы, которые Revit не допускает в номере листа
+PROHIBITED_CHARACTERS = frozenset('\\:{}[]|;<>?`~')
+
+
+class ArgumentException(Exception):
+    pass
+
+
+class InvalidOperationException(Exception):
+    pass
+
+
+class Document(object):
+    """Документ с набором элементов и индексом номеров листов"""
+
+    def __init__(self, title="Stand-in", application=None):
+        self.Title = title
+        self.PathName = ""
+        self.Application = application if application is not None else APPLICATION
+        self._elements = {}
+        self._sheets_by_number = {}
+        self._next_id = 100000
+        self._transaction = None
+        self._group = None
+        self._journal = []  # Отмена изменений текущей транзакции: (функция, объект, значение)
+        self._changes = ({}, {}, {})  # Измененные, добавленные и удаленные элементы по id
+        self._version = DocumentVersion(uuid.uuid4(), 0)
+
+    @staticmethod
+    def GetDocumentVersion(doc):
+        return doc._version
+
+    def Save(self):
+        self._version = DocumentVersion(uuid.uuid4(), self._version.NumberOfSaves + 1)
+
+    def Close(self, save_modified=False):
+        self.Application.DocumentClosing.raise_event(self.Application, DocumentClosingEventArgs(self))
+
+    def add_element(self, element):
+        """Добавляет элемент в документ и назначает ему ElementId"""
+        if element.Id.Value < 0:
+            element.Id = ElementId(self._next_id)
+            self._next_id += 1
+        if isinstance(element, ViewSheet):
+            if element._number in self._sheets_by_number:
+                raise ArgumentException(
+                    "Sheet number '{0}' is already in use".format(element._number))
+            self._sheets_by_number[element._number] = element
+        element.Document = self
+        self._elements[element.Id.Value] = element
+        if self._transaction is not None:
+            self._changes[1][element.Id.Value] = element
+            self._journal.append((self._remove, element, None))
+        return element
+
+    def add_sheet(self, number, name="", section=None, is_placeholder=False,
+                  param_name="ADSK_Штамп Раздел проекта"):
+        """Создает лист с параметром раздела"""
+        sheet = ViewSheet(number, name, is_placeholder)
+        if section is not None:
+            sheet.add_parameter(param_name, StorageType.String, section)
+        return self.add_element(sheet)
+
+    def Delete(self, element_id):
+        """Удаляет элемент, возвращает список удаленных ElementId"""
+        element = self.GetElement(element_id)
+        if element is None:
+            raise ArgumentException("Element {0} does not exist".format(element_id))
+        if self._transaction is None:
+            raise InvalidOperationException(
+                "Modification of the document is forbidden outside of a transaction")
+        self._remove(element)
+        modified, added, deleted = self._changes
+        modified.pop(element.Id.Value, None)
+        if added.pop(element.Id.Value, None) is None:
+            deleted[element.Id.Value] = element
+        self._journal.append((self._restore, element, None))
+        return [element.Id]
+
+    def GetElement(self, element_id):
+        value = element_id.Value if isinstance(element_id, ElementId) else int(element_id)
+        return self._elements.get(value)
+
+    def elements(self):
+        """Все элементы документа в порядке добавления"""
+        return list(self._elements.values())
+
+    def _change_sheet_number(self, sheet, value):
+        if self._transaction is None:
+            raise InvalidOperationException(
+                "Modification of the document is forbidden outside of a transaction")
+        if not value:
+            raise ArgumentException("Sheet number cannot be empty")
+        if not PROHIBITED_CHARACTERS.isdisjoint(value):
+            raise ArgumentException("Sheet number '{0}' contains prohibited characters".format(value))
+        if value == sheet._number:
+            return
+        if value in self._sheets_by_number:
+            raise ArgumentException("Sheet number '{0}' is already in use".format(value))
+        old_number = sheet._number
+        self._modify(sheet, self._set_number, sheet, old_number)
+        self._set_number(sheet, value)
+
+    def _modify(self, element, undo, target, value):
+        """Запоминает изменение элемента в текущей транзакции: при откате вызывается undo(target, value)"""
+        if self._transaction is None:
+            raise InvalidOperationException(
+                "Modification of the document is forbidden outside of a transaction")
+        self._journal.append((undo, target, value))
+        if element.Id.Value not in self._changes[1]:
+            self._changes[0][element.Id.Value] = element
+
+    def _remove(self, element, value=None):
+        del self._elements[element.Id.Value]
+        if isinstance(element, ViewSheet) and self._sheets_by_number.get(element._number) is element:
+            del self._sheets_by_number[element._number]
+
+    def _restore(self, element, value=None):
+        self._elements[element.Id.Value] = element
+        if isinstance(element, ViewSheet):
+            self._sheets_by_number[element._number] = element
+
+    def _set_number(self, sheet, value):
+        if self._sheets_by_number.get(sheet._number) is sheet:
+            del self._sheets_by_number[sheet._number]
+        sheet._number = value
+        self._sheets_by_number[value] = sheet
+
+
+class FilterStringEquals(object):
+    """Сравнение строкового значения параметра на равенство"""
+
+    def Evaluate(self, value, rule_value):
+        return value == rule_value
+
+
+class FilterStringRule(object):
+    """Правило фильтра по строковому значению параметра"""
+
+    def __init__(self, parameter_id, evaluator, value):
+        self.parameter_id = parameter_id
+        self.evaluator = evaluator
+        self.value = value
+
+    def passes(self, element):
+        for param in element._parameters.values():
+            if param.Id == self.parameter_id:
+                if param.StorageType != StorageType.String:
+                    return False
+                return self.evaluator.Evaluate(param.AsString() or "", self.value)
+        return False
+
+
+class ParameterFilterRuleFactory(object):
+    """Построение правил фильтра, как в Revit 2023+"""
+
+    @staticmethod
+    def CreateEqualsRule(parameter_id, value):
+        return FilterStringRule(parameter_id, FilterStringEquals(), value)
+
+
+class ElementParameterFilter(object):
+    """Фильтр по значению параметра"""
+
+    def __init__(self, rule, inverted=False):
+        self._rule = rule
+        self._inverted = inverted
+
+    def PassesFilter(self, element):
+        return self._rule.passes(element) != self._inverted
+
+
+class FilteredElementCollector(object):
+    """
+    Коллектор элементов документа. Фильтры применяются при переборе,
+    без построения промежуточных списков, как на стороне Revit.
+    """
+
+    def __init__(self, doc):
+        self._doc = doc
+        self._filters = []
+
+    def OfClass(self, cls):
+        self._filters.append(lambda e: isinstance(e, cls))
+        return self
+
+    def OfCategory(self, category):
+        self._filters.append(lambda e: e.category == category)
+        return self
+
+    def WhereElementIsNotElementType(self):
+        return self
+
+    def WherePasses(self, element_filter):
+        self._filters.append(element_filter.PassesFilter)
+        return self
+
+    def __iter__(self):
+        filters = self._filters
+        for element in self._doc._elements.values():
+            if all(passes(element) for passes in filters):
+                yield element
+
+    def ToElements(self):
+        return list(self)
+
+    def ToElementIds(self):
+        return [e.Id for e in self]
+
+    def FirstElement(self):
+        for element in self:
+            return element
+        return None
+
+    def GetElementCount(self):
+        return sum(1 for _ in self)
+
+
+# Разделы и соответствующие им латинские коды для синтетических номеров
+SYNTHETIC_SECTIONS = [("АР", "A"), ("КР", "S"), ("ОВ", "M"), ("ВК", "P"), ("ЭО", "E"), ("ГП", "C")]
+# Дополнительные параметры синтетических листов и их значения (пустые - без значения)
+SYNTHETIC_FACETS = [
+    ("Текущая редакция", ["", "", "1", "2", "3", "4"]),
+    ("ADSK_Штамп Том", ["Том 1", "Том 2", "Том 3", "Том 4", ""]),
+]
+
+
+def synthetic_sheet_number(rng, index, section, code):
+    """
+    Номер листа в одном из встречающихся в проектах форматов:
+    "A-101", "АР-12.3", "1-A" или просто "17".
+    index делает номер уникальным в пределах документа.
+    """
+    style = rng.random()
+    if style < 0.4:
+        return "{0}-{1}".format(code, 100 + index)
+    if style < 0.75:
+        return "{0}-{1}.{2}".format(section, index // 10 + 1, index % 10)
+    if style < 0.9:
+        return "{0}-{1}".format(index + 1, code)
+    return str(index + 1)
+
+
+def build_synthetic_document(sheet_count, seed=0, placeholder_ratio=0.02,
+                             empty_section_ratio=0.1):
+    """
+    Создает документ с заданным числом листов.
+    Номера, разделы и пустые значения параметра раздела
+    генерируются детерминированно по seed, значения параметров
+    SYNTHETIC_FACETS - отдельным генератором, чтобы не менять номера.
+    """
+    rng = random.Random(seed)
+    facet_rng = random.Random(-1 - seed)
+    doc = Document("Synthetic {0}".format(sheet_count))
+    for i in range(sheet_count):
+        section, code = rng.choice(SYNTHETIC_SECTIONS)
+        number = synthetic_sheet_number(rng, i, section, code)
+        if rng.random() < empty_section_ratio:
+            section_value = rng.choice(["", "  ", None])
+        else:
+            section_value = section
+        sheet = doc.add_sheet(number, "Лист {0}".format(i + 1), section_value,
+                              is_placeholder=rng.random() < placeholder_ratio)
+        for name, values in SYNTHETIC_FACETS:
+            sheet.add_parameter(name, StorageType.String, facet_rng.choice(values))
+    return doc
+
+
+def apply_synthetic_changes(doc, change_count, seed=0, param_name="ADSK_Штамп Раздел проекта"):
+    """
+    Вносит в документ change_count случайных изменений в одной транзакции:
+    номера, имена и разделы листов, добавление и удаление листов,
+    добавление элементов других категорий.
+    """
+    rng = random.Random(seed)
+    sheets = [e for e in doc.elements() if isinstance(e, ViewSheet)]
+    t = Transaction(doc, "Synthetic changes {0}".format(seed))
+    t.Start()
+    for i in range(change_count):
+        action = rng.random()
+        number = "{0}.{1}-{2}".format(rng.choice(SYNTHETIC_SECTIONS)[1], seed, i)
+        if number in doc._sheets_by_number:
+            continue
+        if action < 0.15 or not sheets:
+            section, code = rng.choice(SYNTHETIC_SECTIONS)
+            sheets.append(doc.add_sheet(number, "Новый лист {0}".format(i), section,
+                                        param_name=param_name))
+            continue
+        sheet = rng.choice(sheets)
+        if action < 0.4:
+            sheet.SheetNumber = number
+        elif action < 0.6:
+            sheet.Name = "Лист {0}.{1}".format(seed, i)
+        elif action < 0.8:
+            param = sheet.LookupParameter(param_name)
+            if param is not None:
+                param.Set(rng.choice(SYNTHETIC_SECTIONS)[0])
+        elif action < 0.9:
+            doc.Delete(sheet.Id)
+            sheets.remove(sheet)
+        else:
+            doc.add_element(Element("Элемент {0}.{1}".format(seed, i)))
+    t.Commit()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Шаблоны новых номеров листов.
+
+Шаблон - текст с полями в фигурных скобках:
+    {n}        - счетчик (начальный номер, шаг), например {n:03} -> 007
+    {section}  - значение параметра раздела листа
+    {number}   - текущий номер листа
+    {name}     - имя листа
+Фигурные скобки в тексте удваиваются: {{ и }}.
+Примеры: "АР-{n:03}", "{section}.{n}", "A{n}".
+
+Шаблон разбирается один раз и компилируется в строку формата str.format,
+после чего номера для всех выбранных листов формируются за один проход.
+Счетчик может начинаться заново для каждого значения раздела.
+"""
+
+import re
+
+# Поля шаблона в порядке позиционных аргументов строки формата
+FIELDS = ('n', 'section', 'number', 'name')
+_FIELD_INDEX = dict((field, index) for index, field in enumerate(FIELDS))
+_FIELD_SAMPLES = (0, "", "", "")
+
+_TOKEN = re.compile(r'\{\{|\}\}|\{([^{}]*)\}|[{}]')
+# Форматы {n}, которые можно обратить: без формата или ширина ("3", "03").
+# Остальные ("x", ">3", "+", ",", ".2f") меняют запись числа, такие шаблоны
+# считаются непозиционными
+_COUNTER_SPEC = re.compile(r'0?\d*\Z')
+
+
+class NumberTemplate(object):
+    """
+    Скомпилированный шаблон номера.
+    positional - номер зависит только от позиции листа в выборе
+    (в шаблоне только поле {n} без формата или с шириной, и счетчик
+    общий для всех разделов).
+    """
+
+    def __init__(self, text, start=1, step=1, per_section=False):
+        self.text = text
+        self.start = start
+        self.step = step
+        self.per_section = per_section
+        self.fields = set()
+        format_parts = []
+        pattern_parts = []
+        literals = []  # Текст без полей (скобки уже не удвоены)
+        counter_fields = []  # (номер части формата, формат) для полей {n}
+        position = 0
+        for match in _TOKEN.finditer(text):
+            literal = text[position:match.start()]
+            format_parts.append(literal)
+            pattern_parts.append(re.escape(literal))
+            literals.append(literal)
+            position = match.end()
+            token = match.group(0)
+            if token in ('{{', '}}'):
+                format_parts.append(token)
+                pattern_parts.append(re.escape(token[0]))
+                literals.append(token[0])
+                continue
+            if match.group(1) is None:
+                raise ValueError("Непарная фигурная скобка в шаблоне: {0}".format(text))
+            field, _, spec = match.group(1).partition(':')
+            field = field.strip()
+            if field not in _FIELD_INDEX:
+                raise ValueError("Неизвестное поле шаблона: {{{0}}}".format(field))
+            self.fields.add(field)
+            if field == 'n':
+                counter_fields.append((len(format_parts), spec))
+            format_parts.append("{{{0}{1}}}".format(_FIELD_INDEX[field], ':' + spec if spec else ''))
+            # Ширина без нуля дополняет число пробелами слева
+            pattern_parts.append(r' *(-?\d+)' if field == 'n' else r'(.*?)')
+        literal = text[position:]
+        format_parts.append(literal)
+        pattern_parts.append(re.escape(literal))
+
+        self._format = "".join(format_parts).format
+        try:
+            self._format(*_FIELD_SAMPLES)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Неверный формат поля в шаблоне {0}: {1}".format(text, e))
+        invertible = all(_COUNTER_SPEC.match(spec) for _, spec in counter_fields)
+        self.positional = self.fields <= {'n'} and not per_section and invertible
+        # "Префикс + {n}" без формата: номер собирается сложением строк
+        self._prefix = None
+        if (self.fields == {'n'} and counter_fields == [(len(format_parts) - 2, '')]
+                and not literal):
+            self._prefix = "".join(literals)
+        self._pattern = None
+        if self.fields == {'n'} and invertible:
+            self._pattern = re.compile("".join(pattern_parts) + r'\Z')
+
+    @classmethod
+    def from_prefix(cls, prefix, start=1, step=1, per_section=False):
+        """Шаблон "префикс + номер", как в исходной нумерации"""
+        escaped = (prefix or '').replace('{', '{{').replace('}', '}}')
+        return cls(escaped + "{n}", start, step, per_section)
+
+    @classmethod
+    def parse(cls, text, start=1, step=1, per_section=False):
+        """Текст с полями - шаблон, иначе - префикс"""
+        if text and '{' in text:
+            return cls(text, start, step, per_section)
+        return cls.from_prefix(text, start, step, per_section)
+
+    def __repr__(self):
+        return "NumberTemplate({0!r}, start={1}, step={2}, per_section={3})".format(
+            self.text, self.start, self.step, self.per_section)
+
+    def counter_value(self, index):
+        """Значение счетчика для листа с порядковым номером index в группе"""
+        return self.start + index * self.step
+
+    def counter_text(self, value):
+        """Номер для значения счетчика (для позиционных шаблонов)"""
+        if self._prefix is not None:
+            return self._prefix + str(value)
+        return self._format(value)
+
+    def counter_of(self, number):
+        """
+        Обратное преобразование для шаблона с одним полем {n}:
+        значение счетчика, дающее этот номер, или None.
+        """
+        if self._pattern is None:
+            return None
+        match = self._pattern.match(number)
+        if match is None:
+            return None
+        values = set(int(value) for value in match.groups())
+        if len(values) != 1:
+            return None
+        value = values.pop()
+        return value if self.counter_text(value) == number else None
+
+    def index_of(self, number):
+        """Позиция в выборе, которой назначается этот номер, или None"""
+        value = self.counter_of(number)
+        if value is None or self.step == 0:
+            return None
+        index, remainder = divmod(value - self.start, self.step)
+        if remainder or index < 0:
+            return None
+        return index
+
+    def format(self, records):
+        """Новые номера для записей листов (в порядке записей) за один проход"""
+        fmt = self._format
+        start = self.start
+        step = self.step
+        if not self.per_section:
+            if self._prefix is not None:
+                prefix = self._prefix
+                return [prefix + str(start + i * step) for i in range(len(records))]
+            if self.fields <= {'n'}:
+                # Только счетчик: остальные аргументы формата не нужны
+                return [fmt(start + i * step) for i in range(len(records))]
+            return [fmt(start + i * step, r.section, r.number, r.name) for i, r in enumerate(records)]
+        counters = {}
+        numbers = []
+        for record in records:
+            section = record.section.strip()
+            index = counters.get(section, 0)
+            counters[section] = index + 1
+            numbers.append(fmt(start + index * step, record.section, record.number, record.name))
+        return numbers
+
+    def plan(self, records):
+        """План [(запись, новый номер), ...] как у engine.plan_renumbering"""
+        records = list(records)
+        return list(zip(records, self.format(records)))
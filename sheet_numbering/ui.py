@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Элементы WPF для диалога нумерации.
+Список листов - виртуализированный ListBox: элементами списка являются
+element_id, а текст и состояние флажка строки берутся из SheetListModel
+через конвертер. Создаются только видимые на экране строки.
+
+Панель предварительного просмотра устроена так же: элементами списка
+являются номера строк RenumberPreview.
+
+ProgressWindow - окно хода записи номеров с кнопкой отмены. Запись идет
+в потоке Revit, поэтому окно обновляется и обрабатывает нажатие кнопки
+между частями записи (commit.commit_chunked).
+
+Модуль импортируется один раз за сеанс Revit, поэтому .NET-классы
+конвертеров регистрируются только один раз.
+"""
+
+import clr
+clr.AddReference('PresentationFramework')
+clr.AddReference('PresentationCore')
+clr.AddReference('WindowsBase')
+
+import System
+from System.Windows import DataTemplate, FrameworkElement, FrameworkElementFactory, Thickness, Window
+from System.Windows.Controls import (Button, CheckBox, ListBox, ProgressBar, ScrollViewer, StackPanel, TextBlock,
+                                     VirtualizingStackPanel, VirtualizationMode, SelectionMode)
+from System.Windows.Media import Brushes
+from System.Windows.Data import Binding, BindingMode, IValueConverter
+from System.Windows.Input import Key, Keyboard, ModifierKeys, MouseButtonEventHandler
+from System.Windows.Threading import DispatcherPriority
+
+from sheet_numbering.instrument import current
+
+
+class SheetRowConverter(IValueConverter):
+    """Преобразует element_id строки в ее текст или состояние флажка"""
+    __namespace__ = "SheetNumbering"
+
+    model = None
+
+    def Convert(self, value, targetType, parameter, culture):
+        if self.model is None or value is None:
+            return None
+        if parameter == "checked":
+            return self.model.is_checked(int(value))
+        return self.model.row_text(int(value))
+
+    def ConvertBack(self, value, targetType, parameter, culture):
+        return System.Windows.DependencyProperty.UnsetValue
+
+
+class PreviewRowConverter(IValueConverter):
+    """Преобразует номер строки предпросмотра в текст "старый -> новый" или цвет"""
+    __namespace__ = "SheetNumbering"
+
+    preview = None
+
+    def Convert(self, value, targetType, parameter, culture):
+        if self.preview is None or value is None or int(value) >= len(self.preview):
+            return None
+        record, new_number, conflict = self.preview.entry(int(value))
+        if parameter == "brush":
+            return Brushes.Red if conflict else Brushes.Black
+        text = "{0} -> {1}".format(record.number, new_number)
+        if conflict:
+            text += "  ({0})".format(conflict)
+        return text
+
+    def ConvertBack(self, value, targetType, parameter, culture):
+        return System.Windows.DependencyProperty.UnsetValue
+
+
+def create_virtual_list_box():
+    """ListBox с виртуализацией и переиспользованием строк"""
+    control = ListBox()
+    control.SelectionMode = SelectionMode.Single
+    control.SetValue(VirtualizingStackPanel.IsVirtualizingProperty, True)
+    control.SetValue(VirtualizingStackPanel.VirtualizationModeProperty, VirtualizationMode.Recycling)
+    control.SetValue(ScrollViewer.CanContentScrollProperty, True)
+    return control
+
+
+def create_binding(converter, parameter):
+    binding = Binding()
+    binding.Mode = BindingMode.OneWay
+    binding.Converter = converter
+    binding.ConverterParameter = parameter
+    return binding
+
+
+class VirtualSheetList(object):
+    """
+    Виртуализированный список листов, привязанный к SheetListModel.
+    Хранит только созданные (видимые) флажки, чтобы обновлять их после
+    изменения выбора, не перебирая весь список. Без модели список создается
+    пустым, модель задается позже через bind.
+    """
+
+    def __init__(self, model=None, fill=True):
+        self.model = None
+        self.realized = set()
+        self.converter = SheetRowConverter()
+        self._sources = {}  # Кэш массивов element_id по сочетанию фильтров
+
+        self.control = create_virtual_list_box()
+        self.control.ItemTemplate = self._create_template()
+        self.control.PreviewKeyDown += self._list_keydown
+        if model is not None:
+            self.bind(model, fill)
+
+    def bind(self, model, fill=True):
+        """Привязывает список к модели и, если fill, показывает строки текущего фильтра"""
+        self.model = model
+        self.converter.model = model
+        self._sources = {}
+        if fill:
+            self.show(model.set_filter(model.filter_value))
+
+    def _create_template(self):
+        factory = FrameworkElementFactory(CheckBox)
+        factory.SetValue(FrameworkElement.MarginProperty, Thickness(5))
+        # Флажок не получает фокус: пробел обрабатывает _list_keydown через модель,
+        # иначе CheckBox переключился бы сам, минуя выбор в модели
+        factory.SetValue(FrameworkElement.FocusableProperty, False)
+        factory.SetBinding(CheckBox.ContentProperty, create_binding(self.converter, "text"))
+        factory.SetBinding(CheckBox.IsCheckedProperty, create_binding(self.converter, "checked"))
+        factory.AddHandler(CheckBox.PreviewMouseLeftButtonDownEvent,
+                           MouseButtonEventHandler(self._checkbox_mousedown))
+        factory.AddHandler(FrameworkElement.LoadedEvent,
+                           System.Windows.RoutedEventHandler(self._checkbox_loaded))
+        factory.AddHandler(FrameworkElement.UnloadedEvent,
+                           System.Windows.RoutedEventHandler(self._checkbox_unloaded))
+        template = DataTemplate()
+        template.VisualTree = factory
+        return template
+
+    def _checkbox_loaded(self, sender, e):
+        self.realized.add(sender)
+
+    def _checkbox_unloaded(self, sender, e):
+        self.realized.discard(sender)
+
+    def _checkbox_mousedown(self, sender, e):
+        try:
+            shift = Keyboard.Modifiers == ModifierKeys.Shift
+            with current().phase('shift_range' if shift else 'click'):
+                self.model.click(int(sender.DataContext), shift)
+                self.refresh()
+            e.Handled = True
+        except:
+            pass
+
+    def _list_keydown(self, sender, e):
+        # Пробел переключает выделенную строку списка (с Shift - диапазон)
+        if e.Key != Key.Space or self.model is None or self.control.SelectedItem is None:
+            return
+        try:
+            shift = Keyboard.Modifiers == ModifierKeys.Shift
+            with current().phase('shift_range' if shift else 'click'):
+                self.model.click(int(self.control.SelectedItem), shift)
+                self.refresh()
+            e.Handled = True
+        except:
+            pass
+
+    def show(self, element_ids):
+        """Показывает строки с указанными element_id"""
+        key = self.model.filter_key
+        source = self._sources.get(key) if key is not None else None
+        if source is None:
+            source = System.Array[System.Int64](element_ids)
+            if key is not None:
+                self._sources[key] = source
+        self.control.ItemsSource = source
+
+    def set_filter(self, value):
+        with current().phase('filter'):
+            self.show(self.model.set_filter(value))
+
+    def set_facet(self, name, value):
+        with current().phase('filter'):
+            self.show(self.model.set_facet(name, value))
+
+    def set_search(self, text):
+        with current().phase('search'):
+            self.show(self.model.set_search(text))
+
+    def refresh(self):
+        """Перечитывает состояние флажков у созданных строк"""
+        for checkbox in list(self.realized):
+            expression = checkbox.GetBindingExpression(CheckBox.IsCheckedProperty)
+            if expression is not None:
+                expression.UpdateTarget()
+
+
+class VirtualPreviewList(object):
+    """
+    Виртуализированная панель предпросмотра нумерации.
+    refresh() вызывается после каждого изменения RenumberPreview:
+    при изменении числа строк заменяется источник, иначе
+    перечитываются только созданные строки.
+    """
+
+    def __init__(self, preview=None):
+        self.preview = preview
+        self.realized = set()
+        self.converter = PreviewRowConverter()
+        self.converter.preview = preview
+        self._length = -1
+
+        self.control = create_virtual_list_box()
+        factory = FrameworkElementFactory(TextBlock)
+        factory.SetValue(FrameworkElement.MarginProperty, Thickness(5, 2, 5, 2))
+        factory.SetBinding(TextBlock.TextProperty, create_binding(self.converter, "text"))
+        factory.SetBinding(TextBlock.ForegroundProperty, create_binding(self.converter, "brush"))
+        factory.AddHandler(FrameworkElement.LoadedEvent,
+                           System.Windows.RoutedEventHandler(self._row_loaded))
+        factory.AddHandler(FrameworkElement.UnloadedEvent,
+                           System.Windows.RoutedEventHandler(self._row_unloaded))
+        template = DataTemplate()
+        template.VisualTree = factory
+        self.control.ItemTemplate = template
+        self.refresh()
+
+    def bind(self, preview):
+        """Привязывает панель к RenumberPreview, созданному после показа окна"""
+        self.preview = preview
+        self.converter.preview = preview
+        self._length = -1
+        self.refresh()
+
+    def _row_loaded(self, sender, e):
+        self.realized.add(sender)
+
+    def _row_unloaded(self, sender, e):
+        self.realized.discard(sender)
+
+    def refresh(self):
+        length = len(self.preview) if self.preview is not None else 0
+        if length != self._length:
+            self._length = length
+            self.control.ItemsSource = System.Array[System.Int32](list(range(length)))
+            return
+        for row in list(self.realized):
+            for dependency_property in (TextBlock.TextProperty, TextBlock.ForegroundProperty):
+                expression = row.GetBindingExpression(dependency_property)
+                if expression is not None:
+                    expression.UpdateTarget()
+
+
+def _do_nothing():
+    pass
+
+
+class ProgressWindow(object):
+    """
+    Окно хода выполнения с кнопкой "Отмена". Кнопка и закрытие окна
+    устанавливают cancellation (commit.Cancellation).
+    """
+
+    def __init__(self, title, total, cancellation):
+        self.cancellation = cancellation
+        self.total = total
+        self._finished = False
+
+        self.window = Window()
+        self.window.Title = title
+        self.window.Width = 420
+        self.window.SizeToContent = System.Windows.SizeToContent.Height
+        self.window.ResizeMode = System.Windows.ResizeMode.NoResize
+        self.window.WindowStartupLocation = System.Windows.WindowStartupLocation.CenterScreen
+        panel = StackPanel()
+        panel.Margin = Thickness(10)
+        self.label = TextBlock()
+        self.label.Text = "Подготовка..."
+        panel.Children.Add(self.label)
+        self.bar = ProgressBar()
+        self.bar.Height = 18
+        self.bar.Margin = Thickness(0, 8, 0, 8)
+        self.bar.Maximum = max(total, 1)
+        panel.Children.Add(self.bar)
+        self.button = Button()
+        self.button.Content = "Отмена"
+        self.button.Width = 100
+        self.button.HorizontalAlignment = System.Windows.HorizontalAlignment.Right
+        self.button.Click += self._cancel_click
+        panel.Children.Add(self.button)
+        self.window.Content = panel
+        self.window.Closing += self._closing
+
+    def _cancel_click(self, sender, e):
+        self.cancellation.cancel()
+        self.button.IsEnabled = False
+        self.label.Text = "Отмена: изменения будут откачены..."
+
+    def _closing(self, sender, e):
+        if not self._finished:
+            # Окно закрывается только после отката или завершения записи
+            self._cancel_click(sender, e)
+            e.Cancel = True
+
+    def show(self):
+        self.window.Show()
+        self.pump()
+
+    def update(self, done, total):
+        """Обработчик хода выполнения для commit_chunked"""
+        self.bar.Value = done
+        if not self.cancellation.requested:
+            self.label.Text = "Записано {0} из {1}".format(done, total)
+        self.pump()
+
+    def pump(self):
+        """Обрабатывает отрисовку и нажатия, накопившиеся во время записи части"""
+        self.window.Dispatcher.Invoke(System.Action(_do_nothing), DispatcherPriority.Background)
+
+    def close(self):
+        self._finished = True
+        self.window.Close()